@@ -0,0 +1,199 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+from markup import TARGET_SIZE, VideoAnnotator, resize_frame, write_atomic, load_session_info
+
+SEGMENTS_PER_TASK = 20
+
+def read_labels(label_path:str, img_width:int, img_height:int) -> list:
+    boxes = []
+    with open(label_path, "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) != 5: continue
+            class_id = int(parts[0])
+            center_x, center_y, width, height = (float(value) for value in parts[1:])
+            x1 = (center_x - width / 2) * img_width
+            y1 = (center_y - height / 2) * img_height
+            x2 = (center_x + width / 2) * img_width
+            y2 = (center_y + height / 2) * img_height
+            boxes.append({'start': (x1, y1), 'end': (x2, y2), 'class_id': class_id})
+    return boxes
+
+def box_iou(box_a:dict, box_b:dict) -> float:
+    (ax1, ay1), (ax2, ay2) = box_a['start'], box_a['end']
+    (bx1, by1), (bx2, by2) = box_b['start'], box_b['end']
+    inter_w = max(0.0, min(ax2, bx2) - max(ax1, bx1))
+    inter_h = max(0.0, min(ay2, by2) - max(ay1, by1))
+    inter = inter_w * inter_h
+    union = (ax2 - ax1) * (ay2 - ay1) + (bx2 - bx1) * (by2 - by1) - inter
+    return inter / union if union > 0 else 0.0
+
+def match_boxes(boxes_a:list, boxes_b:list, min_iou:float) -> list or None:
+    # greedy same-class matching by IoU, None when some box has no partner on the other keyframe
+    pairs = sorted(
+        ((box_iou(a, b), i, j) for i, a in enumerate(boxes_a) for j, b in enumerate(boxes_b) if a['class_id'] == b['class_id']),
+        reverse=True
+    )
+    used_a, used_b, matches = set(), set(), []
+    for iou, i, j in pairs:
+        if iou < min_iou: break
+        if i in used_a or j in used_b: continue
+        used_a.add(i)
+        used_b.add(j)
+        matches.append((boxes_a[i], boxes_b[j]))
+    if len(matches) != len(boxes_a) or len(matches) != len(boxes_b): return None
+    return matches
+
+def interpolate_box(box_a:dict, box_b:dict, t:float) -> dict:
+    start = tuple(a + (b - a) * t for a, b in zip(box_a['start'], box_b['start']))
+    end = tuple(a + (b - a) * t for a, b in zip(box_a['end'], box_b['end']))
+    return {'start': start, 'end': end, 'class_id': box_a['class_id']}
+
+def clip_box(box:dict, img_width:int, img_height:int) -> dict:
+    x1, y1 = box['start']
+    x2, y2 = box['end']
+    x1, x2 = np.clip([x1, x2], 0, img_width)
+    y1, y2 = np.clip([y1, y2], 0, img_height)
+    return {'start': (float(x1), float(y1)), 'end': (float(x2), float(y2)), 'class_id': box['class_id']}
+
+def create_tracker():
+    for module in (cv2, getattr(cv2, 'legacy', None)):
+        for name in ('TrackerCSRT_create', 'TrackerKCF_create'):
+            if module is not None and hasattr(module, name): return getattr(module, name)()
+    return None
+
+def find_segment_runs(labels_dir:str, step:int) -> list:
+    keyframes = sorted(int(name[6:-4]) for name in os.listdir(labels_dir) if name.startswith("frame_") and name.endswith(".txt"))
+    keyframe_set = set(keyframes)
+    # a segment needs labels on both of its keyframes, runs of adjacent segments share one decoder pass
+    starts = [k for k in keyframes if k % step == 0 and k + step in keyframe_set]
+    runs, run = [], []
+    for k in starts:
+        if run and (k != run[-1] + step or len(run) >= SEGMENTS_PER_TASK):
+            runs.append(run)
+            run = []
+        run.append(k)
+    if run: runs.append(run)
+    return runs
+
+def propagate_run(video_path:str, images_dir:str, labels_dir:str, run:list, step:int, method:str, min_iou:float) -> tuple:
+    cv2.setNumThreads(1)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened(): raise RuntimeError(f"can't open video-file {video_path}")
+    width, height = TARGET_SIZE
+    written, skipped = 0, 0
+    cap.set(cv2.CAP_PROP_POS_FRAMES, run[0])
+    index = run[0]
+    try:
+        for keyframe in run:
+            matches = match_boxes(
+                read_labels(os.path.join(labels_dir, f"frame_{keyframe:06d}.txt"), width, height),
+                read_labels(os.path.join(labels_dir, f"frame_{keyframe + step:06d}.txt"), width, height),
+                min_iou
+            )
+            while index < keyframe:
+                if not cap.grab(): return written, skipped
+                index += 1
+            ret, frame = cap.read()
+            if not ret: return written, skipped
+            index += 1
+            if matches is None:
+                skipped += 1
+                continue
+            trackers = []
+            if method == "track":
+                frame = resize_frame(frame, TARGET_SIZE)
+                for box_a, _ in matches:
+                    tracker = create_tracker()
+                    (x1, y1), (x2, y2) = box_a['start'], box_a['end']
+                    if tracker is not None and x2 - x1 >= 1 and y2 - y1 >= 1:
+                        tracker.init(frame, (int(x1), int(y1), int(x2 - x1), int(y2 - y1)))
+                    else: tracker = None
+                    trackers.append(tracker)
+            for offset in range(1, step):
+                ret, frame = cap.read()
+                if not ret: return written, skipped
+                index += 1
+                frame_index = keyframe + offset
+                label_path = os.path.join(labels_dir, f"frame_{frame_index:06d}.txt")
+                if os.path.exists(label_path) and method != "track": continue
+                frame = resize_frame(frame, TARGET_SIZE)
+                boxes = []
+                for i, (box_a, box_b) in enumerate(matches):
+                    box = interpolate_box(box_a, box_b, offset / step)
+                    if trackers and trackers[i] is not None:
+                        ok, (x, y, w, h) = trackers[i].update(frame)
+                        tracked = {'start': (x, y), 'end': (x + w, y + h), 'class_id': box['class_id']}
+                        # trust the tracker only while it agrees with the keyframe trajectory
+                        if ok and box_iou(tracked, box) >= min_iou: box = tracked
+                    boxes.append(box)
+                if os.path.exists(label_path): continue
+                ret, buffer = cv2.imencode('.jpg', frame)
+                if not ret: raise RuntimeError(f"JPEG encode failed on frame {frame_index} of {video_path}")
+                write_atomic(os.path.join(images_dir, f"frame_{frame_index:06d}.jpg"), buffer.tobytes())
+                label_lines = [VideoAnnotator.convert_to_yolo_format(clip_box(box, width, height), width, height) for box in boxes]
+                write_atomic(label_path, "".join(line + "\n" for line in label_lines).encode())
+                written += 1
+    finally: cap.release()
+    return written, skipped
+
+def propagate_sessions(raw_path:str, sessions:list=None, method:str="interp", min_iou:float=0.3, workers:int=None) -> None:
+    if method == "track" and create_tracker() is None:
+        print("Warning: OpenCV tracker is not available in this build, falling back to interpolation")
+        method = "interp"
+    sessions_dir = os.path.join(raw_path, 'sessions')
+    if sessions is None:
+        sessions = sorted(os.path.splitext(name)[0] for name in os.listdir(sessions_dir) if name.endswith(".json")) if os.path.isdir(sessions_dir) else []
+    tasks = []
+    for session in sessions:
+        info = load_session_info(raw_path, session)
+        if info is None:
+            print(f"Warning: no session info for {session}, skipped")
+            continue
+        if not os.path.exists(info["video_path"]):
+            print(f"Warning: video {info['video_path']} of session {session} not found, skipped")
+            continue
+        images_dir = os.path.join(raw_path, 'images', session)
+        labels_dir = os.path.join(raw_path, 'labels', session)
+        if not os.path.isdir(labels_dir): continue
+        for run in find_segment_runs(labels_dir, info["step"]):
+            tasks.append((info["video_path"], images_dir, labels_dir, run, info["step"]))
+    if not tasks:
+        print("No pairs of annotated keyframes found")
+        return
+    start_time = time.perf_counter()
+    total_written, total_skipped = 0, 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(propagate_run, *task, method, min_iou) for task in tasks]
+        for future in as_completed(futures):
+            try: written, skipped = future.result()
+            except Exception as e:
+                print(f"Error: {e}")
+                continue
+            total_written += written
+            total_skipped += skipped
+    elapsed = time.perf_counter() - start_time
+    print(f"Propagated labels to {total_written} frames in {elapsed:.1f}s\n"
+          f"Segments skipped because boxes could not be matched: {total_skipped}")
+
+if __name__ == "__main__":
+    art = '''
+   _____ ___________   _____    __       ____  __________
+  / ___//  _/ ____/ | / /   |  / /      / __ )/  _/_  __/
+  \__ \ / // / __/  |/ / /| | / /      / __  |/ /  / /
+ ___/ // // /_/ / /|  / ___ |/ /___   / /_/ // /  / /
+/____/___/\____/_/ |_/_/  |_/_____/  /_____/___/ /_/
+    '''
+    print(art)
+    parser = argparse.ArgumentParser(description="Propagate keyframe boxes to the frames in between")
+    parser.add_argument("sessions", nargs="*", help="session timestamps, all sessions by default")
+    parser.add_argument("--raw", default="./raw_dataset", help="raw dataset folder")
+    parser.add_argument("--method", choices=["interp", "track"], default="interp", help="linear interpolation or OpenCV tracker")
+    parser.add_argument("--min-iou", type=float, default=0.3, help="IoU needed to match boxes between keyframes")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+    propagate_sessions(args.raw, args.sessions or None, method=args.method, min_iou=args.min_iou, workers=args.workers)
\ No newline at end of file
@@ -1,9 +1,22 @@
 import os
 import shutil
-from sklearn.model_selection import train_test_split
+import errno
+import hashlib
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import cv2
 import ujson as json
 import time
 
+LINK_MODES = ('auto', 'hardlink', 'reflink', 'symlink', 'copy')
+SPLIT_MODES = ('hash', 'stratified')
+DEDUP_MODES = ('off', 'drop', 'group')
+OUTPUT_FORMATS = ('folder', 'shards')
+FICLONE = 0x40049409
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
 def valid_get_config() -> list or None:
     try: 
         with open("./config.json", "r") as config:
@@ -13,51 +26,339 @@ def valid_get_config() -> list or None:
         print(f"Error with config - {e}")
         return None
 
-def create_yolo_structure(raw_path:str, output_path:str, test_dev_ratio, val_ratio) -> None:
+def get_config_param(name:str, default=None):
+    try:
+        with open("./config.json", "r") as config:
+            return json.loads(config.read()).get(name, default)
+    except (OSError, ValueError): return default
+
+def reflink(src:str, dst:str) -> None:
+    try: import fcntl
+    except ImportError: raise OSError(errno.EOPNOTSUPP, "reflink is not supported on this platform")
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        try: fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dst_file.close()
+            os.remove(dst)
+            raise
+
+def link_file(src:str, dst:str, mode:str) -> str:
+    # returns the mode actually used, falling back to a plain copy when the filesystem refuses the link
+    if os.path.lexists(dst): os.remove(dst)
+    chain = {
+        'auto': ('reflink', 'hardlink', 'copy'),
+        'reflink': ('reflink', 'copy'),
+        'hardlink': ('hardlink', 'copy'),
+        'symlink': ('symlink', 'copy'),
+        'copy': ('copy',)
+    }[mode]
+    for attempt in chain:
+        try:
+            if attempt == 'reflink': reflink(src, dst)
+            elif attempt == 'hardlink': os.link(src, dst)
+            elif attempt == 'symlink': os.symlink(os.path.abspath(src), dst)
+            else: shutil.copy2(src, dst)
+            return attempt
+        except OSError:
+            if attempt == 'copy': raise
+    return 'copy'
+
+def probe_link_mode(src:str, dst_dir:str) -> str:
+    # "auto" is resolved once per destination folder, a refused reflink costs a syscall and a removal on every file
+    probe = os.path.join(dst_dir, ".link_probe")
+    for attempt in ('reflink', 'hardlink'):
+        if os.path.lexists(probe): os.remove(probe)
+        try:
+            if attempt == 'reflink': reflink(src, probe)
+            else: os.link(src, probe)
+        except OSError: continue
+        os.remove(probe)
+        return attempt
+    return 'copy'
+
+def file_hash(path:str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''): digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest(dataset_path:str) -> dict:
+    try:
+        with open(os.path.join(dataset_path, MANIFEST_FILE), "r") as f: manifest = json.loads(f.read())
+    except (OSError, ValueError): return {"version": MANIFEST_VERSION, "items": {}}
+    if manifest.get("version") != MANIFEST_VERSION: return {"version": MANIFEST_VERSION, "items": {}}
+    return manifest
+
+def save_manifest(dataset_path:str, manifest:dict) -> None:
+    path = os.path.join(dataset_path, MANIFEST_FILE)
+    with open(f"{path}.tmp", "w") as f: f.write(json.dumps(manifest))
+    os.replace(f"{path}.tmp", path)
+
+def split_for_hash(content_hash:str, test_dev_ratio:float, val_ratio:float) -> str:
+    # a fixed point in [0, 1) per image content, so an image keeps its split across rebuilds
+    position = int(content_hash[:16], 16) / 2**64
+    if position < test_dev_ratio: return 'test_dev'
+    if position < test_dev_ratio + val_ratio: return 'val'
+    return 'train'
+
+def scan_raw_dataset(raw_path:str, manifest:dict, executor:ThreadPoolExecutor, full_scan:bool=False) -> tuple:
+    # every file is stat'ed on each run, labels fixed by hand in place do not touch the folder mtime;
+    # only files whose (size, mtime) changed are hashed again, full_scan rehashes everything
+    old_items = manifest["items"]
+    items, to_hash, changed_folders = {}, [], set()
+    with os.scandir(os.path.join(raw_path, 'images')) as entries:
+        subfolders = sorted(entry.name for entry in entries if entry.is_dir())
+    for subfolder in subfolders:
+        images_dir = os.path.join(raw_path, 'images', subfolder)
+        labels_dir = os.path.join(raw_path, 'labels', subfolder)
+        prefix = f"{subfolder}/"
+        with os.scandir(labels_dir) if os.path.isdir(labels_dir) else nullcontext([]) as entries:
+            labels = {os.path.splitext(entry.name)[0]: entry for entry in entries if entry.name.endswith('.txt')}
+        with os.scandir(images_dir) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(IMAGE_EXTENSIONS): continue
+                stem = os.path.splitext(entry.name)[0]
+                label_entry = labels.get(stem)
+                if label_entry is None:
+                    print(f"Warning: Missing label for {entry.path}")
+                    continue
+                key = prefix + stem
+                image_stat = [entry.stat().st_size, entry.stat().st_mtime_ns]
+                label_stat = [label_entry.stat().st_size, label_entry.stat().st_mtime_ns]
+                old = {} if full_scan else old_items.get(key, {})
+                item = {
+                    "image": entry.name,
+                    "image_stat": image_stat,
+                    "image_hash": old.get("image_hash") if old.get("image_stat") == image_stat and old.get("image") == entry.name else None,
+                    "label_stat": label_stat,
+                    "label_hash": old.get("label_hash") if old.get("label_stat") == label_stat else None
+                }
+                if item["image_hash"] is None: to_hash.append((key, "image_hash", entry.path))
+                if item["label_hash"] is None: to_hash.append((key, "label_hash", label_entry.path))
+                if item["image_hash"] is None or item["label_hash"] is None: changed_folders.add(subfolder)
+                items[key] = item
+    for (key, field, _), digest in zip(to_hash, executor.map(lambda task: file_hash(task[2]), to_hash)):
+        items[key][field] = digest
+    return items, len(subfolders), len(changed_folders), len(to_hash)
+
+def perceptual_hash(path:str) -> int:
+    # difference hash of a 9x8 thumbnail, the JPEG is decoded at 1/8 scale to keep it cheap
+    image = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None: raise ValueError(f"Can't read image {path}")
+    thumb = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+    return int(sum(1 << i for i, bit in enumerate(bits) if bit))
+
+def hamming(a:int, b:int) -> int:
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    def __init__(self) -> None:
+        self.root = None
+
+    def add(self, value:int, key:str) -> None:
+        node = [value, key, {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def query(self, value:int, radius:int) -> list:
+        found, stack = [], [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius: found.append(node[1])
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius: stack.append(child)
+        return found
+
+def find_duplicate_clusters(hashes:dict, max_distance:int, order:list) -> list:
+    # leader clustering keeps every member within max_distance of its representative, the earliest key in order,
+    # so a slowly changing scene from a static camera is not chained into one cluster
+    tree = BKTree()
+    for key in order: tree.add(hashes[key], key)
+    rank = {key: i for i, key in enumerate(order)}
+    assigned, clusters = set(), []
+    for key in order:
+        if key in assigned: continue
+        members = sorted((other for other in tree.query(hashes[key], max_distance) if other not in assigned), key=rank.get)
+        assigned.update(members)
+        if len(members) > 1: clusters.append(members)
+    return clusters
+
+def image_path(raw_path:str, key:str, items:dict) -> str:
+    return os.path.join(raw_path, 'images', key.split('/')[0], items[key]["image"])
+
+def label_path(raw_path:str, key:str, items:dict) -> str:
+    return os.path.join(raw_path, 'labels', key.split('/')[0], os.path.splitext(items[key]["image"])[0] + '.txt')
+
+def read_yolo_boxes(path:str) -> list:
+    boxes = []
+    with open(path, "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) != 5: continue
+            center_x, center_y, width, height = (float(value) for value in parts[1:])
+            boxes.append((int(parts[0]), center_x - width / 2, center_y - height / 2, center_x + width / 2, center_y + height / 2))
+    return boxes
+
+def labels_match(path_a:str, path_b:str, min_iou:float=0.5) -> bool:
+    boxes_a, boxes_b = read_yolo_boxes(path_a), read_yolo_boxes(path_b)
+    if len(boxes_a) != len(boxes_b): return False
+    unmatched = list(boxes_b)
+    for class_a, ax1, ay1, ax2, ay2 in boxes_a:
+        best, best_iou = None, min_iou
+        for box in unmatched:
+            class_b, bx1, by1, bx2, by2 = box
+            if class_b != class_a: continue
+            inter = max(0.0, min(ax2, bx2) - max(ax1, bx1)) * max(0.0, min(ay2, by2) - max(ay1, by1))
+            union = (ax2 - ax1) * (ay2 - ay1) + (bx2 - bx1) * (by2 - by1) - inter
+            iou = inter / union if union > 0 else 1.0
+            if iou >= best_iou: best, best_iou = box, iou
+        if best is None: return False
+        unmatched.remove(best)
+    return True
+
+def deduplicate(raw_path:str, items:dict, old_items:dict, splits:dict, mode:str, max_distance:int, workers:int=None) -> str:
+    for key, item in items.items():
+        old = old_items.get(key)
+        if old is not None and old.get("phash") is not None and old["image_hash"] == item["image_hash"]: item["phash"] = old["phash"]
+    missing = [key for key, item in items.items() if item.get("phash") is None]
+    paths = [image_path(raw_path, key, items) for key in missing]
+    if missing:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            for key, value in zip(missing, executor.map(perceptual_hash, paths, chunksize=64)): items[key]["phash"] = value
+    # the smallest content hash represents a cluster, so the choice is stable between runs
+    order = sorted(items, key=lambda key: items[key]["image_hash"])
+    clusters = find_duplicate_clusters({key: item["phash"] for key, item in items.items()}, max_distance, order)
+    affected, saved_bytes, regrouped = 0, 0, 0
+    for cluster in clusters:
+        representative = cluster[0]
+        for key in cluster[1:]:
+            if mode == 'drop':
+                # only drop a frame whose labels add nothing over the representative's
+                if not labels_match(label_path(raw_path, representative, items), label_path(raw_path, key, items)): continue
+                splits[key] = None
+                saved_bytes += items[key]["image_stat"][0] + items[key]["label_stat"][0]
+                affected += 1
+            elif splits[key] != splits[representative]:
+                splits[key] = splits[representative]
+                regrouped += 1
+        if mode == 'group': affected += len(cluster)
+    if mode == 'drop':
+        return (f"Near-duplicates: {len(clusters)} clusters, {affected} of {len(items)} images dropped, "
+                f"{saved_bytes / 2**20:.1f} MB less training I/O per epoch")
+    return (f"Near-duplicates: {len(clusters)} clusters with {affected} images kept in one split, "
+            f"{regrouped} images moved to their cluster's split")
+
+def check_split_balance(splits:dict, test_dev_ratio:float, val_ratio:float) -> tuple:
+    counts = {'train': 0, 'val': 0, 'test_dev': 0}
+    for split in splits.values():
+        if split is not None: counts[split] += 1
+    total = sum(counts.values())
+    empty, skewed = [], []
+    for split, ratio in (('train', 1 - test_dev_ratio - val_ratio), ('val', val_ratio), ('test_dev', test_dev_ratio)):
+        expected = total * ratio
+        if expected >= 1 and not counts[split]: empty.append(f"{split} is empty, expected about {expected:.0f} images")
+        # small datasets are allowed a couple of images of rounding
+        elif abs(counts[split] - expected) > max(expected / 2, 2): skewed.append(f"{split} has {counts[split]} images, expected about {expected:.0f}")
+    return empty, skewed
+
+def create_yolo_structure(raw_path:str, output_path:str, test_dev_ratio, val_ratio, link_mode:str='auto', workers:int=None, dataset_name:str=None, full_scan:bool=False, split_mode:str='hash', dedup_mode:str='off', dedup_distance:int=4, output_format:str='folder', shard_size_mb:int=256) -> None:
     if not os.path.exists(os.path.join(raw_path, 'images')): raise FileNotFoundError(f"Папка images не найдена в {raw_path}")
     if not os.path.exists(os.path.join(raw_path, 'labels')): raise FileNotFoundError(f"Папка labels не найдена в {raw_path}")
+    if link_mode not in LINK_MODES: raise ValueError(f"Unknown link mode {link_mode}, expected one of {', '.join(LINK_MODES)}")
+    if split_mode not in SPLIT_MODES: raise ValueError(f"Unknown split mode {split_mode}, expected one of {', '.join(SPLIT_MODES)}")
+    if dedup_mode not in DEDUP_MODES: raise ValueError(f"Unknown dedup mode {dedup_mode}, expected one of {', '.join(DEDUP_MODES)}")
+    if output_format not in OUTPUT_FORMATS: raise ValueError(f"Unknown output format {output_format}, expected one of {', '.join(OUTPUT_FORMATS)}")
+    if test_dev_ratio < 0 or val_ratio < 0 or test_dev_ratio + val_ratio >= 1: raise ValueError(f"Separation error: invalid ratios test={test_dev_ratio} val={val_ratio}")
     dirs = ['train', 'val', 'test_dev']
-    dataset_path = os.path.join(output_path, f"dataset_{str(time.time())}")
-    output_path = dataset_path
+    dataset_path = os.path.join(output_path, dataset_name or f"dataset_{str(time.time())}")
     for d in dirs:
         os.makedirs(os.path.join(dataset_path, 'images', d), exist_ok=True)
         os.makedirs(os.path.join(dataset_path, 'labels', d), exist_ok=True)
-    image_files = []
-    label_files = []
-    for subfolder in os.listdir(os.path.join(raw_path, 'images')):
-        subfolder_path = os.path.join(raw_path, 'images', subfolder)
-        if os.path.isdir(subfolder_path):
-            for img in os.listdir(subfolder_path):
-                if img.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
-                    img_path = os.path.join(subfolder_path, img)
-                    label_path = os.path.join(raw_path, 'labels', subfolder, os.path.splitext(img)[0] + '.txt')
-                    if os.path.exists(label_path):
-                        image_files.append(img_path)
-                        label_files.append(label_path)
-                    else: print(f"Warning: Missing label for {img_path}")
-    if not image_files: raise ValueError("Not a single image with markup was found.")
-    try:
-        train_val, test_dev, train_val_labels, test_dev_labels = train_test_split(image_files, label_files, test_size=test_dev_ratio, random_state=42)
-        train, val, train_labels, val_labels = train_test_split(train_val, train_val_labels, test_size=val_ratio/(1-test_dev_ratio), random_state=42)
-    except ValueError as e: raise ValueError(f"Separation error: {e}")
+    manifest = load_manifest(dataset_path)
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as executor:
+        items, folders, changed, hashed = scan_raw_dataset(raw_path, manifest, executor, full_scan)
+        if not items: raise ValueError("Not a single image with markup was found.")
+        old_items = manifest["items"]
+        if split_mode == 'stratified':
+            from label_index import build_index, stratified_split
+            keys = list(items)
+            splits = stratified_split(build_index(raw_path), keys, [items[key]["image_hash"] for key in keys], test_dev_ratio, val_ratio)
+        else: splits = {key: split_for_hash(item["image_hash"], test_dev_ratio, val_ratio) for key, item in items.items()}
+        dedup_report = None
+        if dedup_mode != 'off': dedup_report = deduplicate(raw_path, items, old_items, splits, dedup_mode, dedup_distance, workers)
+        empty, skewed = check_split_balance(splits, test_dev_ratio, val_ratio)
+        # checked before any file is touched, a grouped split that lost a whole subset is refused
+        if empty and dedup_mode == 'group':
+            raise ValueError(f"Near-duplicate grouping left a split empty ({'; '.join(empty)}), lower dedup.max_distance or use dedup mode drop")
+        for warning in empty + skewed: print(f"Warning: {warning}")
 
-    def copy_files(files, labels, subset):
-        for img_path, label_path in zip(files, labels):
-            img_name = os.path.basename(img_path)
-            label_name = os.path.basename(label_path)
-            shutil.copy2(img_path, os.path.join(output_path, 'images', subset, img_name))
-            shutil.copy2(label_path, os.path.join(output_path, 'labels', subset, label_name))
+        def target(key, item, kind):
+            name = key.replace('/', '_')
+            if kind == 'images': name += os.path.splitext(item["image"])[1]
+            else: name += '.txt'
+            return os.path.join(dataset_path, kind, item["split"], name)
 
-    try:
-        copy_files(train, train_labels, 'train')
-        copy_files(val, val_labels, 'val')
-        copy_files(test_dev, test_dev_labels, 'test_dev')
-    except Exception as e: raise RuntimeError(f"Copy error: {e}")
+        removals, tasks = [], []
+        counts = {d: 0 for d in dirs}
+        for key, item in items.items():
+            item["split"] = splits[key]
+            old = old_items.get(key)
+            old_split = old.get("split") if old else None
+            moved = old_split is not None and (old_split != item["split"] or old["image"] != item["image"])
+            if moved: removals += [target(key, old, 'images'), target(key, old, 'labels')]
+            if item["split"] is None: continue
+            counts[item["split"]] += 1
+            src_image = image_path(raw_path, key, items)
+            src_label = label_path(raw_path, key, items)
+            fresh = old_split is None or moved
+            if fresh or old["image_hash"] != item["image_hash"] or (full_scan and not os.path.lexists(target(key, item, 'images'))):
+                tasks.append((src_image, target(key, item, 'images')))
+            if fresh or old["label_hash"] != item["label_hash"] or (full_scan and not os.path.lexists(target(key, item, 'labels'))):
+                tasks.append((src_label, target(key, item, 'labels')))
+        removed = [key for key in old_items if key not in items]
+        for key in removed:
+            if old_items[key].get("split") is not None: removals += [target(key, old_items[key], 'images'), target(key, old_items[key], 'labels')]
+        for path in removals:
+            if os.path.lexists(path): os.remove(path)
+        used_modes, folder_modes = {}, {}
+        if link_mode == 'auto':
+            for src, dst in tasks:
+                if os.path.dirname(dst) not in folder_modes: folder_modes[os.path.dirname(dst)] = probe_link_mode(src, os.path.dirname(dst))
+        try:
+            for used in executor.map(lambda task: link_file(*task, folder_modes.get(os.path.dirname(task[1]), link_mode)), tasks):
+                used_modes[used] = used_modes.get(used, 0) + 1
+        except Exception as e: raise RuntimeError(f"Copy error: {e}")
+    manifest.pop("folders", None)
+    manifest.update(items=items, ratios={"test": test_dev_ratio, "val": val_ratio})
+    save_manifest(dataset_path, manifest)
 
-    print(f"Successfully created:\n"
-          f"Train: {len(train)} images\n"
-          f"Val: {len(val)} images\n"
-          f"Test_dev: {len(test_dev)} images")
+    added = sum(1 for key in items if key not in old_items)
+    print(f"Successfully updated {dataset_path}:\n"
+          f"Train: {counts['train']} images\n"
+          f"Val: {counts['val']} images\n"
+          f"Test_dev: {counts['test_dev']} images\n"
+          f"Folders with changed files: {changed}/{folders}, hashed files: {hashed}\n"
+          f"Added: {added}, removed: {len(removed)}, files placed: {len(tasks)}\n"
+          f"Files by link mode: {', '.join(f'{mode} - {count}' for mode, count in used_modes.items()) or 'none'}")
+    if dedup_report is not None: print(dedup_report)
+    if output_format == 'shards':
+        from dataset_shards import SHARDS_DIR, SUBSETS, pack_dataset
+        # only subsets whose files changed are repacked, plus any that were never packed
+        changed = {os.path.basename(os.path.dirname(path)) for path in removals + [dst for _, dst in tasks]}
+        changed.update(subset for subset in SUBSETS if not os.path.exists(os.path.join(dataset_path, SHARDS_DIR, subset, "samples.json")))
+        if changed: pack_dataset(dataset_path, shard_size_mb, [subset for subset in SUBSETS if subset in changed])
+        else: print("Shards are up to date")
 
 if __name__ == "__main__":
     art = '''
@@ -74,7 +375,15 @@ if __name__ == "__main__":
             raw_path="raw_dataset",
             output_path='datasets',
             test_dev_ratio=ratios["test"],
-            val_ratio=ratios["val"]
+            val_ratio=ratios["val"],
+            link_mode=get_config_param("link_mode", "auto"),
+            dataset_name=get_config_param("dataset_name"),
+            full_scan=get_config_param("full_scan", False),
+            split_mode=get_config_param("split_mode", "hash"),
+            dedup_mode=get_config_param("dedup", {}).get("mode", "off"),
+            dedup_distance=get_config_param("dedup", {}).get("max_distance", 4),
+            output_format=get_config_param("output_format", "folder"),
+            shard_size_mb=get_config_param("shard_size_mb", 256)
         )
     except ValueError as e:
         print(f"Error: {e}")
@@ -0,0 +1,128 @@
+import os
+import shutil
+import argparse
+import numpy as np
+import cv2
+import ujson as json
+from label_index import parse_label_file
+
+SUBSETS = ('train', 'val', 'test_dev')
+SHARDS_DIR = "shards"
+INDEX_DTYPE = np.dtype([('offset', '<i8'), ('length', '<i8')])
+
+def pack_split(dataset_path:str, subset:str, shards_path:str, shard_size_mb:int=256) -> int:
+    images_dir = os.path.join(dataset_path, 'images', subset)
+    labels_dir = os.path.join(dataset_path, 'labels', subset)
+    subset_path = os.path.join(shards_path, subset)
+    os.makedirs(subset_path, exist_ok=True)
+    names = sorted(os.listdir(images_dir)) if os.path.isdir(images_dir) else []
+    shard_limit = shard_size_mb * 2**20
+    samples, label_parts, label_offsets = [], [], [0]
+    shard_id, shard_file, shard_index = -1, None, []
+
+    def close_shard():
+        if shard_file is None: return
+        shard_file.close()
+        np.array(shard_index, dtype=INDEX_DTYPE).tofile(os.path.join(subset_path, f"shard_{shard_id:05d}.idx"))
+
+    try:
+        for name in names:
+            with open(os.path.join(images_dir, name), 'rb') as f: data = f.read()
+            if shard_file is None or shard_file.tell() + len(data) > shard_limit and shard_index:
+                close_shard()
+                shard_id += 1
+                shard_file = open(os.path.join(subset_path, f"shard_{shard_id:05d}.bin"), 'wb')
+                shard_index = []
+            shard_index.append((shard_file.tell(), len(data)))
+            shard_file.write(data)
+            samples.append([name, shard_id, len(shard_index) - 1])
+            label_path = os.path.join(labels_dir, os.path.splitext(name)[0] + '.txt')
+            labels = parse_label_file(label_path) if os.path.exists(label_path) else np.zeros((0, 5), dtype=np.float32)
+            label_parts.append(labels)
+            label_offsets.append(label_offsets[-1] + len(labels))
+    finally: close_shard()
+    labels = np.concatenate(label_parts) if label_parts else np.zeros((0, 5), dtype=np.float32)
+    np.save(os.path.join(subset_path, "labels.npy"), labels)
+    np.save(os.path.join(subset_path, "label_offsets.npy"), np.array(label_offsets, dtype=np.int64))
+    with open(os.path.join(subset_path, "samples.json"), "w") as f: f.write(json.dumps({"shards": shard_id + 1, "samples": samples}))
+    return len(samples)
+
+def pack_dataset(dataset_path:str, shard_size_mb:int=256, subsets:tuple=SUBSETS) -> str:
+    # each subset is packed into a temporary folder and swapped in whole, so readers never see half written shards
+    shards_path = os.path.join(dataset_path, SHARDS_DIR)
+    tmp_path = os.path.join(shards_path, ".tmp")
+    if os.path.exists(tmp_path): shutil.rmtree(tmp_path)
+    counts = {}
+    for subset in subsets:
+        counts[subset] = pack_split(dataset_path, subset, tmp_path, shard_size_mb)
+        subset_path = os.path.join(shards_path, subset)
+        if os.path.exists(subset_path): shutil.rmtree(subset_path)
+        os.replace(os.path.join(tmp_path, subset), subset_path)
+    if os.path.exists(tmp_path): shutil.rmtree(tmp_path)
+    print(f"Packed shards into {shards_path}: {', '.join(f'{subset} - {count}' for subset, count in counts.items())}")
+    return shards_path
+
+class ShardReader:
+    def __init__(self, shards_path:str, subset:str) -> None:
+        subset_path = os.path.join(shards_path, subset)
+        with open(os.path.join(subset_path, "samples.json"), "r") as f: meta = json.loads(f.read())
+        self.names = [sample[0] for sample in meta["samples"]]
+        self.shards = [np.memmap(os.path.join(subset_path, f"shard_{i:05d}.bin"), dtype=np.uint8, mode='r') for i in range(meta["shards"])]
+        indexes = [np.fromfile(os.path.join(subset_path, f"shard_{i:05d}.idx"), dtype=INDEX_DTYPE) for i in range(meta["shards"])]
+        self.locations = [(shard, indexes[shard][position]) for _, shard, position in meta["samples"]]
+        self.labels = np.load(os.path.join(subset_path, "labels.npy"), mmap_mode='r')
+        self.label_offsets = np.load(os.path.join(subset_path, "label_offsets.npy"))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def raw(self, i:int) -> np.array:
+        shard, entry = self.locations[i]
+        return self.shards[shard][entry['offset']:entry['offset'] + entry['length']]
+
+    def sample_labels(self, i:int) -> np.array:
+        return self.labels[self.label_offsets[i]:self.label_offsets[i + 1]]
+
+    def __getitem__(self, i:int) -> tuple:
+        image = cv2.imdecode(np.asarray(self.raw(i)), cv2.IMREAD_COLOR)
+        return image, self.sample_labels(i), self.names[i]
+
+    def iterate(self, shuffle:bool=True, seed:int=None):
+        order = np.random.default_rng(seed).permutation(len(self)) if shuffle else range(len(self))
+        for i in order: yield self[int(i)]
+
+def export_folder(shards_path:str, output_path:str) -> None:
+    for subset in SUBSETS:
+        if not os.path.exists(os.path.join(shards_path, subset, "samples.json")): continue
+        reader = ShardReader(shards_path, subset)
+        images_dir = os.path.join(output_path, 'images', subset)
+        labels_dir = os.path.join(output_path, 'labels', subset)
+        os.makedirs(images_dir, exist_ok=True)
+        os.makedirs(labels_dir, exist_ok=True)
+        for i, name in enumerate(reader.names):
+            with open(os.path.join(images_dir, name), 'wb') as f: f.write(reader.raw(i).tobytes())
+            with open(os.path.join(labels_dir, os.path.splitext(name)[0] + '.txt'), 'w') as f:
+                for class_id, center_x, center_y, width, height in reader.sample_labels(i):
+                    f.write(f"{int(class_id)} {center_x:.6f} {center_y:.6f} {width:.6f} {height:.6f}\n")
+        print(f"Exported {subset}: {len(reader)} images")
+
+if __name__ == "__main__":
+    art = '''
+   _____ ___________   _____    __       ____  __________
+  / ___//  _/ ____/ | / /   |  / /      / __ )/  _/_  __/
+  \__ \ / // / __/  |/ / /| | / /      / __  |/ /  / /
+ ___/ // // /_/ / /|  / ___ |/ /___   / /_/ // /  / /
+/____/___/\____/_/ |_/_/  |_/_____/  /_____/___/ /_/
+    '''
+    print(art)
+    parser = argparse.ArgumentParser(description="Pack a dataset into shards or export shards back to folders")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    pack_parser = subparsers.add_parser("pack", help="pack datasets/<name> into datasets/<name>/shards")
+    pack_parser.add_argument("dataset_path")
+    pack_parser.add_argument("--shard-size", type=int, default=256, help="shard size in MB")
+    export_parser = subparsers.add_parser("export", help="write shards back to the images/labels folder layout")
+    export_parser.add_argument("shards_path")
+    export_parser.add_argument("output_path")
+    args = parser.parse_args()
+    if args.command == "pack": pack_dataset(args.dataset_path, args.shard_size)
+    else: export_folder(args.shards_path, args.output_path)
\ No newline at end of file
@@ -0,0 +1,122 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import ujson as json
+from markup import FRAME_STEP, TARGET_SIZE, resize_frame, write_atomic, write_session_info
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.wmv')
+STATE_FILE = "extract_state.json"
+
+def load_state(output_dir:str) -> dict:
+    try:
+        with open(os.path.join(output_dir, STATE_FILE), "r") as f: return json.loads(f.read())
+    except (OSError, ValueError): return {}
+
+def save_state(output_dir:str, state:dict) -> None:
+    write_atomic(os.path.join(output_dir, STATE_FILE), json.dumps(state, indent=4).encode())
+
+def video_key(video_path:str) -> str:
+    stat = os.stat(video_path)
+    return f"{os.path.abspath(video_path)}|{stat.st_size}|{int(stat.st_mtime)}"
+
+def last_written_frame(images_dir:str) -> int or None:
+    frames = [int(name[6:-4]) for name in os.listdir(images_dir) if name.startswith("frame_") and name.endswith(".jpg")]
+    return max(frames) if frames else None
+
+def extract_video(video_path:str, images_dir:str, labels_dir:str, stride:int, jpeg_quality:int) -> int:
+    # one decoder per process, the pool already spreads videos over the cores
+    cv2.setNumThreads(1)
+    os.makedirs(images_dir, exist_ok=True)
+    os.makedirs(labels_dir, exist_ok=True)
+    last_frame = last_written_frame(images_dir)
+    index = 0 if last_frame is None else last_frame + stride
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened(): raise RuntimeError(f"can't open video-file {video_path}")
+    if index: cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+    written = 0
+    try:
+        while True:
+            if index % stride == 0:
+                ret, frame = cap.read()
+                if not ret: break
+                ret, buffer = cv2.imencode('.jpg', resize_frame(frame, TARGET_SIZE), [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+                if not ret: raise RuntimeError(f"JPEG encode failed on frame {index} of {video_path}")
+                write_atomic(os.path.join(images_dir, f"frame_{index:06d}.jpg"), buffer.tobytes())
+                written += 1
+            elif not cap.grab(): break
+            index += 1
+    finally: cap.release()
+    return written
+
+def extract_directory(video_dir:str, output_dir:str, stride:int=FRAME_STEP, workers:int=None, jpeg_quality:int=95) -> None:
+    if not os.path.isdir(video_dir): raise FileNotFoundError(f"Video folder {video_dir} not found")
+    if stride < 1: raise ValueError(f"Stride must be positive, got {stride}")
+    videos = sorted(os.path.join(video_dir, name) for name in os.listdir(video_dir) if name.lower().endswith(VIDEO_EXTENSIONS))
+    if not videos: raise ValueError(f"No videos found in {video_dir}")
+    os.makedirs(output_dir, exist_ok=True)
+    state = load_state(output_dir)
+    tasks = {}
+    for video_path in videos:
+        key = video_key(video_path)
+        entry = state.setdefault(key, {})
+        if entry.get("done"): continue
+        if "session" not in entry:
+            session = str(time.time())
+            while os.path.exists(os.path.join(output_dir, 'images', session)): session = str(time.time())
+            entry.update(session=session, stride=stride)
+            write_session_info(output_dir, session, video_path, stride)
+        tasks[key] = (video_path, entry["session"], entry.get("stride", stride))
+    save_state(output_dir, state)
+    skipped = len(videos) - len(tasks)
+    print(f"Videos: {len(videos)}, already extracted: {skipped}, to process: {len(tasks)}")
+    start_time = time.perf_counter()
+    total_written = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {
+            executor.submit(
+                extract_video,
+                video_path,
+                os.path.join(output_dir, 'images', session),
+                os.path.join(output_dir, 'labels', session),
+                video_stride,
+                jpeg_quality
+            ): key
+            for key, (video_path, session, video_stride) in tasks.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            video_path, session, _ = tasks[key]
+            try: written = future.result()
+            except Exception as e:
+                print(f"Error: {video_path} - {e}")
+                continue
+            total_written += written
+            state[key]["done"] = True
+            save_state(output_dir, state)
+            print(f"{os.path.basename(video_path)} -> {session}: {written} frames")
+    elapsed = time.perf_counter() - start_time
+    print(f"Extracted {total_written} frames in {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    art = '''
+   _____ ___________   _____    __       ____  __________
+  / ___//  _/ ____/ | / /   |  / /      / __ )/  _/_  __/
+  \__ \ / // / __/  |/ / /| | / /      / __  |/ /  / /
+ ___/ // // /_/ / /|  / ___ |/ /___   / /_/ // /  / /
+/____/___/\____/_/ |_/_/  |_/_____/  /_____/___/ /_/
+    '''
+    print(art)
+    parser = argparse.ArgumentParser(description="Headless frame extraction into raw_dataset")
+    parser.add_argument("video_dir", nargs="?", help="folder with video files")
+    parser.add_argument("--stride", type=int, default=FRAME_STEP, help="keep every Nth frame")
+    parser.add_argument("--output", default="./raw_dataset", help="raw dataset folder")
+    parser.add_argument("--workers", type=int, default=None, help="number of decoder processes")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG quality")
+    args = parser.parse_args()
+    video_dir = args.video_dir or input("Enter path to folder with videos: ").replace("'", "").replace('"', '')
+    try:
+        extract_directory(video_dir, args.output, stride=args.stride, workers=args.workers, jpeg_quality=args.quality)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
\ No newline at end of file
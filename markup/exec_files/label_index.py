@@ -0,0 +1,203 @@
+import os
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import ujson as json
+
+INDEX_DIR = "label_index"
+INDEX_VERSION = 1
+CHUNK_SIZE = 2000
+BOX_DTYPE = np.dtype([('image', '<i4'), ('class', '<i4'), ('cx', '<f4'), ('cy', '<f4'), ('w', '<f4'), ('h', '<f4')])
+
+def valid_get_config() -> list or None:
+    try:
+        with open("./config.json", "r") as config:
+            return json.loads(config.read())["classes"]
+    except (OSError, ValueError) as e:
+        print(f"Error with config - {e}")
+        return None
+
+def parse_label_file(path:str) -> np.array:
+    with open(path, "r") as f: values = f.read().split()
+    if len(values) % 5: raise ValueError(f"expected 5 values per line, got {len(values)} values")
+    return np.array(values, dtype=np.float32).reshape(-1, 5)
+
+def parse_chunk(tasks:list) -> list:
+    parsed = []
+    for key, path in tasks:
+        try: parsed.append((key, parse_label_file(path), None))
+        except (OSError, ValueError) as e: parsed.append((key, None, str(e)))
+    return parsed
+
+def scan_labels(raw_path:str) -> dict:
+    labels = {}
+    labels_root = os.path.join(raw_path, 'labels')
+    with os.scandir(labels_root) as folders:
+        for folder in sorted(folders, key=lambda entry: entry.name):
+            if not folder.is_dir(): continue
+            with os.scandir(folder.path) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.txt'):
+                        labels[f"{folder.name}/{entry.name[:-4]}"] = (entry.path, entry.stat().st_mtime_ns)
+    return labels
+
+class LabelIndex:
+    def __init__(self, keys:list, mtimes:list, offsets:np.array, boxes:np.array, errors:dict) -> None:
+        self.keys = keys
+        self.mtimes = mtimes
+        self.offsets = offsets
+        self.boxes = boxes
+        self.errors = errors
+        self.key_ids = {key: i for i, key in enumerate(keys)}
+
+    def image_boxes(self, key:str) -> np.array:
+        i = self.key_ids[key]
+        return self.boxes[self.offsets[i]:self.offsets[i + 1]]
+
+    def validate(self, num_classes:int, tolerance:float=1e-3) -> dict:
+        boxes = self.boxes
+        x1 = boxes['cx'] - boxes['w'] / 2
+        y1 = boxes['cy'] - boxes['h'] / 2
+        x2 = boxes['cx'] + boxes['w'] / 2
+        y2 = boxes['cy'] + boxes['h'] / 2
+        low, high = -tolerance, 1 + tolerance
+        return {
+            'out_of_range': np.flatnonzero((x1 < low) | (y1 < low) | (x2 > high) | (y2 > high)),
+            'bad_class': np.flatnonzero((boxes['class'] < 0) | (boxes['class'] >= num_classes)),
+            'zero_area': np.flatnonzero((boxes['w'] <= 0) | (boxes['h'] <= 0))
+        }
+
+    def class_counts(self, num_classes:int) -> np.array:
+        classes = self.boxes['class']
+        classes = classes[(classes >= 0) & (classes < num_classes)]
+        return np.bincount(classes, minlength=num_classes)
+
+    def size_histograms(self, num_classes:int, bins:int=10) -> tuple:
+        # box size as sqrt of the relative area, one row of counts per class
+        edges = np.linspace(0, 1, bins + 1)
+        sizes = np.sqrt(np.clip(self.boxes['w'] * self.boxes['h'], 0, 1))
+        classes = self.boxes['class']
+        valid = (classes >= 0) & (classes < num_classes)
+        bin_ids = np.clip(np.searchsorted(edges, sizes[valid], side='right') - 1, 0, bins - 1)
+        histograms = np.zeros((num_classes, bins), dtype=np.int64)
+        np.add.at(histograms, (classes[valid], bin_ids), 1)
+        return histograms, edges
+
+    def image_strata(self) -> np.array:
+        # each image is assigned the smallest class id among its boxes, images without boxes get -1;
+        # it depends on the image alone, so adding sessions never moves an image to another stratum
+        strata = np.full(len(self.keys), -1, dtype=np.int64)
+        classes = self.boxes['class'].astype(np.int64)
+        valid = classes >= 0
+        if not valid.any(): return strata
+        smallest = np.full(len(self.keys), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(smallest, self.boxes['image'][valid], classes[valid])
+        strata[smallest != np.iinfo(np.int64).max] = smallest[smallest != np.iinfo(np.int64).max]
+        return strata
+
+def build_index(raw_path:str, workers:int=None) -> LabelIndex:
+    index_path = os.path.join(raw_path, INDEX_DIR)
+    labels = scan_labels(raw_path)
+    cached = load_index(raw_path)
+    keys = sorted(labels)
+    mtimes = [labels[key][1] for key in keys]
+    if cached is not None and cached.keys == keys and cached.mtimes == mtimes: return cached
+    cached_mtimes = {} if cached is None else dict(zip(cached.keys, cached.mtimes))
+    changed = [(key, labels[key][0]) for key in keys if cached_mtimes.get(key) != labels[key][1]]
+    parsed, errors = {}, {} if cached is None else {key: error for key, error in cached.errors.items() if key in labels}
+    if changed:
+        chunks = [changed[i:i + CHUNK_SIZE] for i in range(0, len(changed), CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            for chunk in executor.map(parse_chunk, chunks):
+                for key, values, error in chunk:
+                    parsed[key] = values if values is not None else np.zeros((0, 5), dtype=np.float32)
+                    if error is None: errors.pop(key, None)
+                    else: errors[key] = error
+    parts, offsets = [], [0]
+    for image_id, key in enumerate(keys):
+        if key in parsed:
+            values = parsed[key]
+            part = np.empty(len(values), dtype=BOX_DTYPE)
+            part['class'] = values[:, 0].astype(np.int32)
+            for column, name in enumerate(('cx', 'cy', 'w', 'h'), start=1): part[name] = values[:, column]
+        else: part = np.array(cached.image_boxes(key))
+        part['image'] = image_id
+        parts.append(part)
+        offsets.append(offsets[-1] + len(part))
+    boxes = np.concatenate(parts) if parts else np.empty(0, dtype=BOX_DTYPE)
+    offsets = np.array(offsets, dtype=np.int64)
+    # drop the old memory map before replacing its file, Windows refuses to replace a mapped file
+    cached = None
+    os.makedirs(index_path, exist_ok=True)
+    for name, array in (("boxes.npy", boxes), ("offsets.npy", offsets)):
+        with open(os.path.join(index_path, f"{name}.tmp"), "wb") as f: np.save(f, array)
+        os.replace(os.path.join(index_path, f"{name}.tmp"), os.path.join(index_path, name))
+    meta = {"version": INDEX_VERSION, "keys": keys, "mtimes": mtimes, "errors": errors}
+    with open(os.path.join(index_path, "meta.json.tmp"), "w") as f: f.write(json.dumps(meta))
+    os.replace(os.path.join(index_path, "meta.json.tmp"), os.path.join(index_path, "meta.json"))
+    return load_index(raw_path)
+
+def load_index(raw_path:str) -> LabelIndex or None:
+    index_path = os.path.join(raw_path, INDEX_DIR)
+    try:
+        with open(os.path.join(index_path, "meta.json"), "r") as f: meta = json.loads(f.read())
+        if meta.get("version") != INDEX_VERSION: return None
+        boxes = np.load(os.path.join(index_path, "boxes.npy"), mmap_mode='r')
+        offsets = np.load(os.path.join(index_path, "offsets.npy"))
+    except (OSError, ValueError): return None
+    if len(offsets) != len(meta["keys"]) + 1 or boxes.dtype != BOX_DTYPE: return None
+    return LabelIndex(meta["keys"], meta["mtimes"], offsets, boxes, meta["errors"])
+
+def stratum_position(stratum:int, content_hash:str) -> float:
+    # a fixed point in [0, 1) per stratum and image content, independent draws for every stratum
+    digest = hashlib.blake2b(f"{stratum}:{content_hash}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2**64
+
+def stratified_split(index:LabelIndex, keys:list, hashes:list, test_dev_ratio:float, val_ratio:float) -> dict:
+    # every image is compared with fixed thresholds, so its split only changes when its own labels change stratum;
+    # no ranking inside a stratum, adding a session never moves existing images
+    strata = index.image_strata()
+    splits = {}
+    for key, content_hash in zip(keys, hashes):
+        stratum = int(strata[index.key_ids[key]]) if key in index.key_ids else -1
+        position = stratum_position(stratum, content_hash)
+        if position < test_dev_ratio: splits[key] = 'test_dev'
+        elif position < test_dev_ratio + val_ratio: splits[key] = 'val'
+        else: splits[key] = 'train'
+    return splits
+
+def print_report(index:LabelIndex, classes:list) -> None:
+    num_classes = len(classes)
+    issues = index.validate(num_classes)
+    print(f"Images: {len(index.keys)}, boxes: {len(index.boxes)}")
+    for key, error in index.errors.items(): print(f"Unreadable label {key}: {error}")
+    for issue, rows in issues.items():
+        print(f"{issue}: {len(rows)}")
+        for row in rows[:10]:
+            box = index.boxes[row]
+            print(f"    {index.keys[box['image']]}: {box['class']} {box['cx']:.6f} {box['cy']:.6f} {box['w']:.6f} {box['h']:.6f}")
+        if len(rows) > 10: print(f"    ... and {len(rows) - 10} more")
+    counts = index.class_counts(num_classes)
+    histograms, edges = index.size_histograms(num_classes)
+    print("Boxes per class (size histogram over sqrt(w*h), bins of {:.2f}):".format(edges[1]))
+    for class_id, name in enumerate(classes):
+        print(f"    {class_id} - {name}: {counts[class_id]}  {' '.join(str(value) for value in histograms[class_id])}")
+
+if __name__ == "__main__":
+    art = '''
+   _____ ___________   _____    __       ____  __________
+  / ___//  _/ ____/ | / /   |  / /      / __ )/  _/_  __/
+  \__ \ / // / __/  |/ / /| | / /      / __  |/ /  / /
+ ___/ // // /_/ / /|  / ___ |/ /___   / /_/ // /  / /
+/____/___/\____/_/ |_/_/  |_/_____/  /_____/___/ /_/
+    '''
+    print(art)
+    parser = argparse.ArgumentParser(description="Label index, validation and statistics")
+    parser.add_argument("--raw", default="./raw_dataset", help="raw dataset folder")
+    parser.add_argument("--workers", type=int, default=None, help="number of parser processes")
+    args = parser.parse_args()
+    classes = valid_get_config()
+    if classes is not None:
+        print_report(build_index(args.raw, args.workers), classes)
+    input("\nEnter to exit")
\ No newline at end of file
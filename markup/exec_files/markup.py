@@ -3,6 +3,12 @@ import os
 import ujson as json
 import numpy as np
 import time
+import threading
+import queue
+from collections import OrderedDict
+
+FRAME_STEP = 10
+TARGET_SIZE = (1280, 720)
 
 def valid_get_config() -> list or None:
     try: 
@@ -13,17 +19,240 @@ def valid_get_config() -> list or None:
         print(f"Error with config - {e}")
         return None
 
+def get_config_param(name:str, default=None):
+    try:
+        with open("./config.json", "r") as config:
+            return json.loads(config.read()).get(name, default)
+    except (OSError, ValueError): return default
+
+def snap_to_step(frame_index:int, step:int=FRAME_STEP) -> int:
+    return (frame_index // step) * step
+
+def resize_frame(frame:np.array, size:tuple=TARGET_SIZE) -> np.array:
+    h, w = frame.shape[:2]
+    if (w, h) != tuple(size):
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    return frame
+
+def write_atomic(path:str, data:bytes) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f: f.write(data)
+    os.replace(tmp_path, path)
+
+class AnnotationWriter:
+    def __init__(self, workers:int=2, max_pending:int=64) -> None:
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.errors = []
+        self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(max(1, workers))]
+        for thread in self.threads: thread.start()
+
+    def _worker(self) -> None:
+        while True:
+            task = self.queue.get()
+            if task is None: break
+            frame, frame_path, label_lines, label_path = task
+            try:
+                ret, buffer = cv2.imencode('.jpg', frame)
+                if not ret: raise RuntimeError(f"JPEG encode failed for {frame_path}")
+                write_atomic(frame_path, buffer.tobytes())
+                write_atomic(label_path, "".join(line + "\n" for line in label_lines).encode())
+            except Exception as e:
+                self.errors.append(e)
+                print(f"Error saving annotation - {e}")
+
+    def submit(self, frame:np.array, frame_path:str, label_lines:list, label_path:str) -> None:
+        self.queue.put((frame, frame_path, label_lines, label_path))
+
+    def close(self) -> None:
+        for _ in self.threads: self.queue.put(None)
+        for thread in self.threads: thread.join()
+
+class FramePrefetcher:
+    SEEK_GAP = 3
+
+    def __init__(self, video_path:str, step:int, resize, max_frames:int) -> None:
+        self.cap = cv2.VideoCapture(video_path)
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.step = step
+        self.resize = resize
+        self.max_frames = max(2, max_frames)
+        self.ahead = max(1, self.max_frames * 2 // 3)
+        self.behind = self.max_frames - self.ahead - 1
+        self.cache = OrderedDict()
+        self.failed = set()
+        self.cond = threading.Condition()
+        self.center = 0
+        self.pos = 0
+        self.stopped = False
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def window(self) -> range:
+        start = max(0, self.center - self.behind * self.step)
+        stop = min(self.total_frames, self.center + (self.ahead + 1) * self.step)
+        return range(start, stop, self.step)
+
+    def _next_missing(self) -> int or None:
+        # current frame first, then forward, then the backward tail from its lowest index so it is read sequentially
+        if self.center not in self.cache and self.center not in self.failed: return self.center
+        window = self.window()
+        for index in window:
+            if index > self.center and index not in self.cache and index not in self.failed: return index
+        for index in window:
+            if index >= self.center: break
+            if index not in self.cache and index not in self.failed: return index
+        return None
+
+    def _evict(self) -> None:
+        window = self.window()
+        for index in list(self.cache.keys()):
+            if len(self.cache) <= self.max_frames: break
+            if index not in window: del self.cache[index]
+
+    def _worker(self) -> None:
+        while True:
+            with self.cond:
+                while not self.stopped and (target := self._next_missing()) is None: self.cond.wait()
+                if self.stopped: break
+            if target < self.pos or target - self.pos > self.step * self.SEEK_GAP:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                self.pos = target
+            while self.pos < target and self.cap.grab(): self.pos += 1
+            ret, frame = self.cap.read()
+            self.pos += 1
+            if ret: frame = self.resize(frame)
+            with self.cond:
+                if ret:
+                    self.cache[target] = frame
+                    self._evict()
+                else: self.failed.add(target)
+                self.cond.notify_all()
+        self.cap.release()
+
+    def upcoming(self, count:int) -> range:
+        # the shown frame and the next count frames, callers of this and below hold cond
+        return range(self.center, min(self.total_frames, self.center + (count + 1) * self.step), self.step)
+
+    def peek(self, index:int) -> np.array or None:
+        return self.cache.get(index)
+
+    def is_failed(self, index:int) -> bool:
+        return index in self.failed
+
+    def get(self, index:int) -> np.array or None:
+        with self.cond:
+            self.center = index
+            self.cond.notify_all()
+            while index not in self.cache and index not in self.failed: self.cond.wait()
+            if index in self.failed: return None
+            self.cache.move_to_end(index)
+            return self.cache[index]
+
+    def stop(self) -> None:
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.thread.join()
+
+def write_session_info(output_dir:str, session:str, video_path:str, step:int) -> None:
+    sessions_dir = os.path.join(output_dir, 'sessions')
+    os.makedirs(sessions_dir, exist_ok=True)
+    info = {"video_path": os.path.abspath(video_path), "step": step, "size": list(TARGET_SIZE)}
+    write_atomic(os.path.join(sessions_dir, f"{session}.json"), json.dumps(info, indent=4).encode())
+
+def load_session_info(output_dir:str, session:str) -> dict or None:
+    try:
+        with open(os.path.join(output_dir, 'sessions', f"{session}.json"), "r") as f: return json.loads(f.read())
+    except (OSError, ValueError): return None
+
+def init_model(model_path:str):
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+    model.fuse()
+    print("YOLO-model is loaded")
+    return model
+
+class PreAnnotator:
+    def __init__(self, model_path:str, prefetcher:FramePrefetcher, classes:list, conf:float=0.5, batch:int=4, imgsz:int=640, lookahead:int=8, class_map:dict=None) -> None:
+        self.model = init_model(model_path)
+        self.prefetcher = prefetcher
+        self.conf = conf
+        self.batch = max(1, batch)
+        self.imgsz = imgsz
+        self.lookahead = lookahead
+        class_map = class_map or {}
+        self.class_ids = {}
+        for model_id, name in self.model.names.items():
+            name = class_map.get(name, name)
+            if name in classes: self.class_ids[int(model_id)] = classes.index(name)
+        self.proposals = {}
+        self.stopped = False
+        self.disabled = False
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        # without matching classes every proposal would be discarded, so the model never runs
+        if self.class_ids: self.thread.start()
+
+    def _pending(self) -> list:
+        # decoded frames and the ones that can't be decoded, the latter get no proposals
+        prefetcher = self.prefetcher
+        indices = [index for index in prefetcher.upcoming(self.lookahead) if index not in self.proposals]
+        return [index for index in indices if prefetcher.peek(index) is not None or prefetcher.is_failed(index)][:self.batch]
+
+    def _to_boxes(self, result) -> list:
+        boxes = []
+        for x1, y1, x2, y2, conf, class_id in result.boxes.data.cpu().numpy():
+            class_id = self.class_ids.get(int(class_id))
+            if class_id is None: continue
+            boxes.append({'start': (int(x1), int(y1)), 'end': (int(x2), int(y2)), 'class_id': class_id, 'proposal': True, 'conf': float(conf)})
+        return boxes
+
+    def _worker(self) -> None:
+        cond = self.prefetcher.cond
+        while True:
+            with cond:
+                while not self.stopped and not (batch := self._pending()): cond.wait()
+                if self.stopped: break
+                for index in batch:
+                    if self.prefetcher.is_failed(index): self.proposals[index] = []
+                batch = [index for index in batch if index not in self.proposals]
+                frames = [self.prefetcher.peek(index) for index in batch]
+            if not batch: continue
+            try: results = self.model.predict(frames, imgsz=self.imgsz, conf=self.conf, verbose=False)
+            except Exception as e:
+                print(f"Warning: pre-annotation failed - {e}, proposals are disabled")
+                with cond: self.disabled = True
+                break
+            with cond:
+                window = self.prefetcher.window()
+                for index in list(self.proposals.keys()):
+                    if index not in window: del self.proposals[index]
+                for index, result in zip(batch, results): self.proposals[index] = self._to_boxes(result)
+
+    def get(self, index:int) -> list or None:
+        with self.prefetcher.cond:
+            # once the model failed every frame counts as seeded, run stops polling for proposals
+            if self.disabled: return []
+            boxes = self.proposals.get(index)
+            return None if boxes is None else [dict(box) for box in boxes]
+
+    def stop(self) -> None:
+        with self.prefetcher.cond:
+            self.stopped = True
+            self.prefetcher.cond.notify_all()
+        if self.thread.is_alive(): self.thread.join()
+
 class VideoAnnotator:
     def __init__(self, video_path, output_dir):
         self.video_path = video_path
         self.output_dir = output_dir
-        self.cap = cv2.VideoCapture(video_path)
-        self.orig_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        self.orig_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
-        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.target_width = 1280
-        self.target_height = 720
+        # metadata only, frames come from the prefetcher's own decoder
+        cap = cv2.VideoCapture(video_path)
+        self.orig_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.orig_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = cap.get(cv2.CAP_PROP_FPS)
+        self.total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        self.target_width, self.target_height = TARGET_SIZE
         self.current_frame = 0
         time_stamp = str(time.time())
         self.images_dir = os.path.join(output_dir, 'images')
@@ -34,6 +263,7 @@ class VideoAnnotator:
         self.labels_dir = os.path.join(self.labels_dir, time_stamp)
         os.makedirs(self.images_dir, exist_ok=True)
         os.makedirs(self.labels_dir, exist_ok=True)
+        write_session_info(output_dir, time_stamp, video_path, FRAME_STEP)
         self.classes = valid_get_config()
         self.current_class = 0
         self.annotations = {}
@@ -44,12 +274,36 @@ class VideoAnnotator:
         self.final_boxes = []
         self.scale_x = self.target_width / self.orig_width
         self.scale_y = self.target_height / self.orig_height
+        self.window_name = "Video Annotator"
+        self.base_frame = None
+        self.display_frame = None
+        self.dirty = True
+        cache_mb = get_config_param("frame_cache_mb", 512)
+        frame_bytes = self.target_width * self.target_height * 3
+        self.prefetcher = FramePrefetcher(video_path, FRAME_STEP, self.resize_frame, int(cache_mb * 1024 * 1024 // frame_bytes))
+        self.writer = AnnotationWriter(get_config_param("writer_threads", 2))
+        self.pre_annotator = None
+        self.proposals_seeded = True
+        pre_annotation = get_config_param("pre_annotation", {})
+        if pre_annotation.get("model") and self.classes:
+            if os.path.exists(pre_annotation["model"]):
+                self.pre_annotator = PreAnnotator(
+                    pre_annotation["model"],
+                    self.prefetcher,
+                    self.classes,
+                    conf=pre_annotation.get("conf", 0.5),
+                    batch=pre_annotation.get("batch", 4),
+                    imgsz=pre_annotation.get("imgsz", 640),
+                    lookahead=pre_annotation.get("lookahead", 8),
+                    class_map=pre_annotation.get("class_map")
+                )
+                if not self.pre_annotator.class_ids:
+                    print("Warning: no model classes match config.json classes, proposals are disabled")
+                    self.pre_annotator = None
+            else: print(f"Warning: pre-annotation model {pre_annotation['model']} not found, proposals are disabled")
     
     def resize_frame(self, frame:np.array) -> np.array:
-        h, w = frame.shape[:2]
-        if w != self.target_width or h != self.target_height:
-            frame = cv2.resize(frame, (self.target_width, self.target_height), interpolation=cv2.INTER_AREA)
-        return frame
+        return resize_frame(frame, (self.target_width, self.target_height))
     
     def mouse_callback(self, event, x, y, flags, param):
         if event == cv2.EVENT_LBUTTONDOWN:
@@ -58,22 +312,56 @@ class VideoAnnotator:
             self.temp_boxes.append({'start': (x, y), 'end': (x, y), 'class_id': self.current_class})
         
         elif event == cv2.EVENT_MOUSEMOVE:
-            if self.drawing: self.temp_boxes[-1]['end'] = (x, y)
+            if not self.drawing: return
+            self.temp_boxes[-1]['end'] = (x, y)
         
         elif event == cv2.EVENT_LBUTTONUP:
+            if not self.drawing: return
             self.drawing = False
             self.temp_boxes[-1]['end'] = (x, y)
             x1, y1 = self.temp_boxes[-1]['start']
             x2, y2 = self.temp_boxes[-1]['end']
             self.temp_boxes[-1]['start'] = (min(x1, x2), min(y1, y2))
             self.temp_boxes[-1]['end'] = (max(x1, x2), max(y1, y2))
+        else: return
+        # waitKey(0) in run blocks until a key, so mouse edits are drawn from here
+        self.dirty = True
+        self.render()
     
+    def seed_proposals(self) -> None:
+        if self.proposals_seeded: return
+        # nothing to wait for, run can block on input again
+        if self.pre_annotator is None:
+            self.proposals_seeded = True
+            return
+        proposals = self.pre_annotator.get(self.current_frame)
+        if proposals is None: return
+        self.proposals_seeded = True
+        if not proposals: return
+        # in front of the user's boxes so the box being dragged stays at temp_boxes[-1]
+        self.temp_boxes[:0] = proposals
+        self.dirty = True
+
+    def accept_proposals(self) -> None:
+        accepted = [box for box in self.temp_boxes if box.get('proposal')]
+        self.temp_boxes = [box for box in self.temp_boxes if not box.get('proposal')]
+        for box in accepted:
+            del box['proposal'], box['conf']
+            self.final_boxes.append(box)
+
+    def reject_proposals(self) -> None:
+        self.temp_boxes = [box for box in self.temp_boxes if not box.get('proposal')]
+
     def draw_boxes(self, frame:np.array) -> None:
         for box in self.temp_boxes:
             x1, y1 = box['start']
             x2, y2 = box['end']
             class_id = box['class_id']
             class_name = self.classes[class_id] if class_id < len(self.classes) else str(class_id)
+            if box.get('proposal'):
+                cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 128, 0), 2)
+                cv2.putText(frame, f"{class_name} {box['conf']:.2f}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 128, 0), 2)
+                continue
             cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
             cv2.putText(frame, class_name, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (36, 255, 12), 2)
         
@@ -85,7 +373,7 @@ class VideoAnnotator:
             cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
             cv2.putText(frame, class_name, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
     
-    def draw_controls(self, frame:np.array) -> None:
+    def build_hud(self) -> None:
         controls = [
             f"{', '.join([f'{index} - {item}' for index, item in enumerate(self.classes)])}",
             "Controls:",
@@ -97,21 +385,48 @@ class VideoAnnotator:
             f"0-{len(self.classes)-1} - select class",
             "q - quit"
         ]
-        overlay_1 = frame.copy()
-        cv2.rectangle(overlay_1, (10, 10), (400, 40 + len(controls)*25), (0, 0, 0), -1)
-        cv2.addWeighted(overlay_1, 0.7, frame, 0.3, 0, frame)
-        overlay_2 = frame.copy()
-        cv2.rectangle(overlay_2, (401, 10), (800, 50), (0, 0, 0), -1)
-        cv2.addWeighted(overlay_2, 0.7, frame, 0.3, 0, frame)
+        if self.pre_annotator is not None: controls.insert(-1, "a/r - accept/reject proposals")
+        class_text = f"Current class: {self.classes[self.current_class]} ({self.current_class})"
+        panel_bottom = 40 + len(controls)*25
+        hud_height = min(panel_bottom + 30, self.target_height)
+        # sized to the text, long class lists widen the panel up to the frame width
+        widths = [cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)[0][0] for text in controls]
+        body_width = max(widths[1:] + [cv2.getTextSize(class_text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0][0]])
+        hud_width = min(max(widths[0], body_width) + 40, self.target_width)
+        hud = np.zeros((hud_height, hud_width, 3), dtype=np.uint8)
         for i, text in enumerate(controls):
             y = 40 + i * 25
-            cv2.putText(frame, text, (20, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-        class_text = f"Current class: {self.classes[self.current_class]} ({self.current_class})"
-        cv2.putText(frame, class_text, (20, 40 + len(controls)*25 + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+            cv2.putText(hud, text, (20, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+        cv2.putText(hud, class_text, (20, panel_bottom + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+        self.hud = hud
+        self.hud_mask = hud.any(axis=2)[..., None]
+        body_right = min(body_width + 30, hud_width)
+        self.hud_panels = [(10, 10, body_right, panel_bottom + 1)]
+        if widths[0] + 30 > body_right: self.hud_panels.append((body_right, 10, min(widths[0] + 30, hud_width), 51))
+
+    def compose_base(self, frame:np.array) -> None:
+        base = frame.copy()
+        for x1, y1, x2, y2 in self.hud_panels:
+            roi = base[y1:y2, x1:x2]
+            roi[:] = cv2.convertScaleAbs(roi, alpha=0.3)
+        hud_height, hud_width = self.hud.shape[:2]
+        np.copyto(base[:hud_height, :hud_width], self.hud, where=self.hud_mask)
         frame_text = f"Frame: {self.current_frame}/{self.total_frames}"
-        cv2.putText(frame, frame_text, (self.target_width - 200, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        cv2.putText(base, frame_text, (self.target_width - 200, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        cv2.putText(base, f"{FRAME_STEP}x FRAME MODE", (20, self.target_height - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+        self.base_frame = base
+        if self.display_frame is None or self.display_frame.shape != base.shape: self.display_frame = np.empty_like(base)
+        self.dirty = True
+
+    def render(self) -> None:
+        if not self.dirty or self.base_frame is None: return
+        np.copyto(self.display_frame, self.base_frame)
+        self.draw_boxes(self.display_frame)
+        cv2.imshow(self.window_name, self.display_frame)
+        self.dirty = False
     
-    def convert_to_yolo_format(self, box:dict, img_width:int, img_height:int) -> str:
+    @staticmethod
+    def convert_to_yolo_format(box:dict, img_width:int, img_height:int) -> str:
         x1, y1 = box['start']
         x2, y2 = box['end']
         center_x = (x1 + x2) / 2 / img_width
@@ -120,79 +435,89 @@ class VideoAnnotator:
         height = (y2 - y1) / img_height
         return f"{box['class_id']} {center_x:.6f} {center_y:.6f} {width:.6f} {height:.6f}"
     
-    def save_annotation(self) -> None:
-        if not self.final_boxes: return
-        ret, frame = self.cap.read()
-        if not ret: return
-        frame = self.resize_frame(frame)
+    def save_annotation(self, frame:np.array) -> None:
+        if not self.final_boxes or frame is None: return
         frame_filename = f"frame_{self.current_frame:06d}.jpg"
         frame_path = os.path.join(self.images_dir, frame_filename)
-        cv2.imwrite(frame_path, frame)
         label_filename = f"frame_{self.current_frame:06d}.txt"
         label_path = os.path.join(self.labels_dir, label_filename)
         height, width = frame.shape[:2]
-        with open(label_path, 'w') as f:
-            for box in self.final_boxes:
-                yolo_line = self.convert_to_yolo_format(box, width, height)
-                f.write(yolo_line + "\n")
+        label_lines = [self.convert_to_yolo_format(box, width, height) for box in self.final_boxes]
+        self.writer.submit(frame, frame_path, label_lines, label_path)
         self.annotations[self.current_frame] = {
             'image_path': frame_path,
             'label_path': label_path,
             'boxes': self.final_boxes.copy()
         }
     
+    def go_to(self, frame:np.array, index:int) -> np.array:
+        if index == self.current_frame: return frame
+        next_frame = self.prefetcher.get(index)
+        if next_frame is None:
+            # the shown frame and index stay paired, a stale frame is never saved under the new index
+            print(f"Warning: frame {index} can't be decoded, staying on frame {self.current_frame}")
+            self.prefetcher.get(self.current_frame)
+            return frame
+        self.save_annotation(frame)
+        self.current_frame = index
+        self.temp_boxes = []
+        self.final_boxes = []
+        self.proposals_seeded = False
+        self.compose_base(next_frame)
+        return next_frame
+
     def run(self) -> None:
-        cv2.namedWindow("Video Annotator", cv2.WINDOW_NORMAL)
-        cv2.setMouseCallback("Video Annotator", self.mouse_callback)
-        self.current_frame = (self.current_frame // 10) * 10
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame)
-        ret, frame = self.cap.read()
-        if not ret:
+        cv2.namedWindow(self.window_name, cv2.WINDOW_NORMAL)
+        cv2.setMouseCallback(self.window_name, self.mouse_callback)
+        self.current_frame = snap_to_step(self.current_frame)
+        frame = self.prefetcher.get(self.current_frame)
+        if frame is None:
             print("Failed to read video")
+            self.writer.close()
+            if self.pre_annotator is not None: self.pre_annotator.stop()
+            self.prefetcher.stop()
             return
-        frame = self.resize_frame(frame)
-        display_frame = np.zeros_like(frame)
+        self.build_hud()
+        self.compose_base(frame)
+        self.proposals_seeded = False
         while True:
-            display_frame[:] = frame.copy()
-            self.draw_boxes(display_frame)
-            self.draw_controls(display_frame)
-            cv2.putText(display_frame, "10x FRAME MODE", (20, self.target_height - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-            cv2.imshow("Video Annotator", display_frame)
-            key = cv2.waitKey(1) & 0xFF
+            self.seed_proposals()
+            self.render()
+            # poll only while proposals for the shown frame are still being computed
+            key = cv2.waitKey(0 if self.proposals_seeded else 50) & 0xFF
+            if cv2.getWindowProperty(self.window_name, cv2.WND_PROP_VISIBLE) < 1: break
             if key == ord('q'): break
-            elif key == ord('n'):
-                self.save_annotation()
-                self.current_frame = min(self.current_frame + 10, self.total_frames - 2)
-                self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame)
-                ret, frame = self.cap.read()
-                if ret:
-                    frame = self.resize_frame(frame)
-                self.temp_boxes = []
-                self.final_boxes = []
-            elif key == ord('p'):
-                self.save_annotation()
-                self.current_frame = max(self.current_frame - 10, 0)
-                self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame)
-                ret, frame = self.cap.read()
-                if ret:
-                    frame = self.resize_frame(frame)
-                self.temp_boxes = []
-                self.final_boxes = []
+            elif key == ord('n'): frame = self.go_to(frame, min(self.current_frame + FRAME_STEP, self.total_frames - 2))
+            elif key == ord('p'): frame = self.go_to(frame, max(self.current_frame - FRAME_STEP, 0))
             elif key == ord('s'):
                 self.final_boxes.extend(self.temp_boxes)
                 self.temp_boxes = []
+                self.dirty = True
+            elif key == ord('a'):
+                self.accept_proposals()
+                self.dirty = True
+            elif key == ord('r'):
+                self.reject_proposals()
+                self.dirty = True
             elif key == ord('d'):
                 if self.temp_boxes: self.temp_boxes.pop()
                 elif self.final_boxes: self.final_boxes.pop()
+                self.dirty = True
             elif key == ord('c'):
                 self.temp_boxes = []
                 self.final_boxes = []
+                self.dirty = True
             elif ord('0') <= key <= ord('9'):
                 class_num = key - ord('0')
-                if class_num < len(self.classes): self.current_class = class_num
+                if class_num < len(self.classes) and class_num != self.current_class:
+                    self.current_class = class_num
+                    self.build_hud()
+                    self.compose_base(frame)
         
-        self.save_annotation()
-        self.cap.release()
+        self.save_annotation(frame)
+        self.writer.close()
+        if self.pre_annotator is not None: self.pre_annotator.stop()
+        self.prefetcher.stop()
         cv2.destroyAllWindows()
 
 
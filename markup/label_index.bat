@@ -0,0 +1,3 @@
+@echo off
+call ../.venv/scripts/activate
+python ./exec_files/label_index.py %*
\ No newline at end of file
@@ -1,3 +1,216 @@
+import os
+import json
+import time
+import hashlib
+import platform
+import argparse
+import subprocess
+
+TUNER_CACHE = "./tuner_cache.json"
+TUNER_VERSION = 1
+WORKER_OPTIONS = (0, 2, 4, 8, 16)
+CACHE_OPTIONS = ("disk", "ram")
+LOADER_BATCHES = 30
+MAX_BATCH = 256
+MEMORY_FRACTION = 0.85
+IMAGE_EXTENSIONS = (".bmp", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp")
+
+COMMAND = {
+    "data": "data.yaml",
+    "model": "yolov8n.pt",
+    "epochs": 100,
+    "imgsz": 640,
+    "name": "yolo_custom",
+    # "device": 0,
+    # "optimizer": "Adam",
+    # "lr0": 0.01,
+    # "cos_lr": True,
+    # "warmup_epochs": 3,
+    # "warmup_momentum": 0.8,
+    # "warmup_bias_lr": 0.1,
+    # "amp": True,
+    # "overlap_mask": True,
+    # "mask_ratio": 2,
+    # "close_mosaic": 5,
+    # "val": True
+}
+
+def build_command(command:dict) -> str:
+    command_str = [f"{key}={value}" for key, value in command.items()]
+    command_str = ["yolo detect train"] + command_str
+    return " ".join(command_str)
+
+def file_hash(path:str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''): digest.update(chunk)
+    return digest.hexdigest()
+
+def machine_info() -> str:
+    # part of the cache key, read without importing torch so a cache hit stays cheap
+    import psutil
+    try: device = subprocess.run(["nvidia-smi", "--query-gpu=name", "--format=csv,noheader"], capture_output=True, text=True, timeout=10).stdout.splitlines()[0].strip()
+    except (OSError, subprocess.SubprocessError, IndexError): device = ""
+    device = device or platform.processor() or platform.machine()
+    return f"{platform.node()} {device} x{os.cpu_count()} {psutil.virtual_memory().total >> 30}GB"
+
+def scan_images(path:str) -> list:
+    # a folder is walked for images, a .txt file lists them one per line relative to its own folder
+    if os.path.isfile(path):
+        with open(path, "r") as f: lines = [line.strip() for line in f if line.strip()]
+        return [line if os.path.isabs(line) else os.path.join(os.path.dirname(path), line) for line in lines]
+    files, folders = [], [path]
+    while folders:
+        with os.scandir(folders.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(): folders.append(entry.path)
+                elif entry.name.lower().endswith(IMAGE_EXTENSIONS): files.append(entry.path)
+    return sorted(files)
+
+def train_images(data_yaml:str) -> list:
+    # the train split named in data.yaml, resolved the way the yaml is usually written, next to it or under its path key
+    import yaml
+    with open(data_yaml, "r") as f: data = yaml.safe_load(f)
+    root = str(data.get("path") or "")
+    if not os.path.isabs(root): root = os.path.join(os.path.dirname(os.path.abspath(data_yaml)), root)
+    train = data["train"] if isinstance(data["train"], list) else [data["train"]]
+    files = []
+    for path in train:
+        path = path if os.path.isabs(path) else os.path.join(root, path)
+        if not os.path.exists(path): raise FileNotFoundError(f"train images {path} from {data_yaml} not found")
+        files.extend(scan_images(path))
+    return files
+
+def load_tuner_cache() -> dict:
+    try:
+        with open(TUNER_CACHE, "r") as f: cache = json.loads(f.read())
+    except (OSError, ValueError): return {"version": TUNER_VERSION, "runs": {}}
+    if cache.get("version") != TUNER_VERSION: return {"version": TUNER_VERSION, "runs": {}}
+    return cache
+
+def save_tuner_cache(cache:dict) -> None:
+    with open(f"{TUNER_CACHE}.tmp", "w") as f: f.write(json.dumps(cache, indent=4))
+    os.replace(f"{TUNER_CACHE}.tmp", TUNER_CACHE)
+
+def build_loader(data:dict, imgsz:int, batch:int, workers:int, cache:str):
+    from ultralytics.cfg import get_cfg
+    from ultralytics.data import build_dataloader, build_yolo_dataset
+    cfg = get_cfg(overrides={"imgsz": imgsz, "cache": False if cache == "none" else cache, "workers": workers})
+    dataset = build_yolo_dataset(cfg, data["train"], batch, data, mode="train")
+    return dataset, build_dataloader(dataset, batch, workers, shuffle=True)
+
+def ram_cache_fits(files:list, imgsz:int, samples:int=30) -> bool:
+    # ultralytics keeps every image resized to imgsz on its long side, estimated from a sample
+    import cv2
+    import psutil
+    sample = files[::max(len(files) // samples, 1)][:samples]
+    sizes = []
+    for path in sample:
+        image = cv2.imread(path)
+        if image is None: continue
+        ratio = imgsz / max(image.shape[:2])
+        sizes.append(image.shape[0] * image.shape[1] * 3 * ratio * ratio)
+    needed = sum(sizes) / max(len(sizes), 1) * len(files)
+    available = psutil.virtual_memory().available
+    print(f"RAM cache needs about {needed / 2**30:.1f}GB, available {available / 2**30:.1f}GB")
+    return needed < available * 0.5
+
+def measure_loader(data:dict, imgsz:int, batch:int, workers:int, cache:str, batches:int=LOADER_BATCHES) -> dict:
+    start_time = time.perf_counter()
+    _, loader = build_loader(data, imgsz, batch, workers, cache)
+    iterator = iter(loader)
+    next(iterator)
+    setup_time = time.perf_counter() - start_time
+    images = 0
+    start_time = time.perf_counter()
+    for _ in range(batches):
+        try: item = next(iterator)
+        except StopIteration:
+            iterator = iter(loader)
+            item = next(iterator)
+        images += len(item["img"])
+    elapsed = time.perf_counter() - start_time
+    del iterator, loader
+    result = {"workers": workers, "cache": cache, "images_per_sec": round(images / elapsed, 1), "setup_s": round(setup_time, 1)}
+    print(f"workers={workers} cache={cache}: {result['images_per_sec']} images/sec, setup {result['setup_s']}s")
+    return result
+
+def probe_batch(model_name:str, imgsz:int, max_batch:int=MAX_BATCH) -> int:
+    import torch
+    import psutil
+    from ultralytics import YOLO
+    cuda = torch.cuda.is_available()
+    device = torch.device("cuda:0" if cuda else "cpu")
+    model = YOLO(model_name).model.to(device).train()
+    for parameter in model.parameters(): parameter.requires_grad_(True)
+    process = psutil.Process()
+    # on CPU the resident size stands in for peak memory, the allocator keeps freed blocks
+    if cuda: limit = torch.cuda.get_device_properties(device).total_memory * MEMORY_FRACTION
+    else: limit = process.memory_info().rss + psutil.virtual_memory().available * (MEMORY_FRACTION - 0.15)
+
+    def train_step(batch:int) -> int or None:
+        try:
+            if cuda: torch.cuda.reset_peak_memory_stats(device)
+            outputs = model(torch.rand(batch, 3, imgsz, imgsz, device=device))
+            sum(output.float().sum() for output in (outputs if isinstance(outputs, (list, tuple)) else [outputs])).backward()
+            model.zero_grad(set_to_none=True)
+            return torch.cuda.max_memory_reserved(device) if cuda else process.memory_info().rss
+        except RuntimeError: return None
+        finally:
+            if cuda: torch.cuda.empty_cache()
+
+    sizes, used = [], []
+    best, batch = 1, 1
+    while batch <= max_batch:
+        memory = train_step(batch)
+        if memory is None or memory > limit: break
+        best = batch
+        sizes.append(batch)
+        used.append(memory)
+        print(f"batch={batch}: {memory / 2**30:.2f}GB")
+        if len(sizes) >= 2 and used[-1] > used[-2]:
+            # linear fit of the last two probes, stop doubling once the next one would not fit
+            fit = int(sizes[-1] + (limit - used[-1]) * (sizes[-1] - sizes[-2]) / (used[-1] - used[-2]))
+            if fit < batch * 2:
+                best = min(max(fit, best), max_batch)
+                break
+        batch *= 2
+    if best >= 16: best -= best % 8
+    # the fitted size was never run, step down until it really fits
+    while best > 1:
+        memory = train_step(best)
+        if memory is not None and memory <= limit: break
+        best //= 2
+    del model
+    return best
+
+def tune(data_yaml:str, model_name:str, imgsz:int, retune:bool=False, batches:int=LOADER_BATCHES) -> dict:
+    # the cache is checked before ultralytics builds anything, a repeated run only lists the train images
+    files = train_images(data_yaml)
+    size = sum(os.path.getsize(path) for path in files)
+    print(f"Dataset: {len(files)} train images, {size / 2**20:.0f}MB")
+    key = f"{file_hash(data_yaml)}_{len(files)}_{size}_{model_name}_{imgsz}_{machine_info()}"
+    cache = load_tuner_cache()
+    if not retune and key in cache["runs"]:
+        print("Using cached measurements")
+        return cache["runs"][key]
+    from ultralytics.data.utils import check_det_dataset
+    data = check_det_dataset(data_yaml)
+    batch = min(probe_batch(model_name, imgsz), len(files))
+    print(f"Largest batch that fits: {batch}")
+    workers_options = sorted({workers for workers in WORKER_OPTIONS if workers <= (os.cpu_count() or 1)} | {min(os.cpu_count() or 1, 8)})
+    results = [measure_loader(data, imgsz, batch, workers, "none", batches) for workers in workers_options]
+    # caching is only tried with the two best worker counts, a RAM cache is rebuilt for every loader
+    top_workers = [result["workers"] for result in sorted(results, key=lambda result: -result["images_per_sec"])[:2]]
+    for cache_mode in CACHE_OPTIONS:
+        if cache_mode == "ram" and not ram_cache_fits(files, imgsz): continue
+        results.extend(measure_loader(data, imgsz, batch, workers, cache_mode, batches) for workers in top_workers)
+    best = max(results, key=lambda result: result["images_per_sec"])
+    run = {"batch": batch, "workers": best["workers"], "cache": best["cache"], "images": len(files), "measurements": results}
+    cache["runs"][key] = run
+    save_tuner_cache(cache)
+    return run
+
 if __name__ == "__main__":
     art = '''
    _____ ___________   _____    __       ____  __________
@@ -7,29 +220,23 @@ if __name__ == "__main__":
 /____/___/\____/_/ |_/_/  |_/_____/  /_____/___/ /_/
     '''
     print(art)
-    command = {
-        "data": "data.yaml",
-        "model": "yolov8n.pt",
-        "epochs": 100,
-        "imgsz": 640,
-        "name": "yolo_custom",
-        # "batch": 16,
-        # "workers": 8,
-        # "device": 0,
-        # "optimizer": "Adam",
-        # "lr0": 0.01,
-        # "cos_lr": True,
-        # "warmup_epochs": 3,
-        # "warmup_momentum": 0.8,
-        # "warmup_bias_lr": 0.1,
-        # "amp": True,
-        # "overlap_mask": True,
-        # "mask_ratio": 2,
-        # "close_mosaic": 5, 
-        # "val": True
-    }
-    command_str = [f"{key}={value}" for key, value in command.items()]
-    command_str = ["yolo detect train"] + command_str
-    command_str = " ".join(command_str)
-    print(f"Command - {command_str}")
-    input("\nEnter to exit")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Training command creator")
+    parser.add_argument("--data", default=COMMAND["data"], help="dataset yaml")
+    parser.add_argument("--model", default=COMMAND["model"], help="model to train")
+    parser.add_argument("--imgsz", type=int, default=COMMAND["imgsz"], help="training image size")
+    parser.add_argument("--epochs", type=int, default=COMMAND["epochs"], help="number of epochs")
+    parser.add_argument("--no-tune", action="store_true", help="print the command without measuring this machine")
+    parser.add_argument("--retune", action="store_true", help="measure again even if cached results exist")
+    parser.add_argument("--batches", type=int, default=LOADER_BATCHES, help="loader batches timed per setting")
+    args = parser.parse_args()
+    command = dict(COMMAND, data=args.data, model=args.model, imgsz=args.imgsz, epochs=args.epochs)
+    if not args.no_tune:
+        try:
+            run = tune(args.data, args.model, args.imgsz, args.retune, args.batches)
+            print("\nworkers  cache  images/sec  setup, s")
+            for result in sorted(run["measurements"], key=lambda result: -result["images_per_sec"]):
+                print(f"{result['workers']:>7}  {result['cache']:>5}  {result['images_per_sec']:>10}  {result['setup_s']:>8}")
+            command.update(batch=run["batch"], workers=run["workers"], cache=False if run["cache"] == "none" else run["cache"])
+        except Exception as e: print(f"Error while tuning - {e}, printing the untuned command")
+    print(f"Command - {build_command(command)}")
+    input("\nEnter to exit")
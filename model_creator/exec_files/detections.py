@@ -0,0 +1,172 @@
+import json
+import time
+import queue
+import struct
+import threading
+import cv2
+import numpy as np
+
+DETECTION_DTYPE = np.dtype([
+    ('stream', '<i4'),
+    ('frame', '<i8'),
+    ('x1', '<f4'),
+    ('y1', '<f4'),
+    ('x2', '<f4'),
+    ('y2', '<f4'),
+    ('conf', '<f4'),
+    ('class', '<i4')
+])
+
+def extract_detections(result, frame_index:int, stream:int=0) -> np.array:
+    # boxes.data is [x1, y1, x2, y2, (track id,) conf, class], one device->host copy per frame
+    data = result.boxes.data.cpu().numpy()
+    detections = np.empty(len(data), dtype=DETECTION_DTYPE)
+    detections['stream'] = stream
+    detections['frame'] = frame_index
+    for column, key in enumerate(('x1', 'y1', 'x2', 'y2')): detections[key] = data[:, column]
+    detections['conf'] = data[:, -2]
+    detections['class'] = data[:, -1]
+    return detections
+
+def class_color(class_id:int) -> tuple:
+    hue = (class_id * 47) % 180
+    return tuple(int(value) for value in cv2.cvtColor(np.uint8([[[hue, 220, 255]]]), cv2.COLOR_HSV2BGR)[0, 0])
+
+def draw_detections(frame:np.array, detections:np.array, names:dict=None) -> np.array:
+    # same look for inferred and carried detections, results.plot() is not available without a fresh result
+    names = names or {}
+    for x1, y1, x2, y2, conf, class_id in zip(detections['x1'], detections['y1'], detections['x2'], detections['y2'], detections['conf'], detections['class']):
+        color = class_color(int(class_id))
+        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), color, 2)
+        cv2.putText(frame, f"{names.get(int(class_id), int(class_id))} {conf:.2f}", (int(x1), max(int(y1) - 5, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    return frame
+
+class RingBufferSink:
+    def __init__(self, capacity:int=100000) -> None:
+        self.buffer = np.zeros(capacity, dtype=DETECTION_DTYPE)
+        self.position = 0
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def write(self, detections:np.array) -> None:
+        detections = detections[-len(self.buffer):]
+        with self.lock:
+            end = self.position + len(detections)
+            head = min(end, len(self.buffer)) - self.position
+            self.buffer[self.position:self.position + head] = detections[:head]
+            self.buffer[:len(detections) - head] = detections[head:]
+            self.position = end % len(self.buffer)
+            self.total += len(detections)
+
+    def latest(self, count:int=None) -> np.array:
+        with self.lock:
+            count = min(count or len(self.buffer), self.total, len(self.buffer))
+            return np.roll(self.buffer, -self.position)[len(self.buffer) - count:]
+
+    def close(self) -> None:
+        pass
+
+class JsonlSink:
+    def __init__(self, path:str, names:dict=None) -> None:
+        self.file = open(path, "w")
+        self.names = names or {}
+
+    def write(self, detections:np.array) -> None:
+        rows = detections.tolist()
+        self.file.writelines(
+            json.dumps({
+                "stream": stream, "frame": frame, "bbox": [x1, y1, x2, y2],
+                "conf": round(conf, 4), "class": class_id, "class_name": self.names.get(class_id, str(class_id))
+            }) + "\n"
+            for stream, frame, x1, y1, x2, y2, conf, class_id in rows
+        )
+
+    def close(self) -> None:
+        self.file.close()
+
+class NpyAppendSink:
+    HEADER_SIZE = 256
+
+    def __init__(self, path:str, flush_every:int=10000) -> None:
+        self.file = open(path, "wb")
+        self.count = 0
+        self.flush_every = flush_every
+        self.unflushed = 0
+        self.file.write(self._header())
+
+    def _header(self) -> bytes:
+        # fixed size header, rewritten in place so the file stays a valid .npy while it grows
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(DETECTION_DTYPE), self.count)
+        header = header.ljust(self.HEADER_SIZE - 11) + "\n"
+        return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+    def write(self, detections:np.array) -> None:
+        self.file.write(detections.astype(DETECTION_DTYPE, copy=False).tobytes())
+        self.count += len(detections)
+        self.unflushed += len(detections)
+        if self.unflushed >= self.flush_every: self.flush()
+
+    def flush(self) -> None:
+        position = self.file.tell()
+        self.file.seek(0)
+        self.file.write(self._header())
+        self.file.seek(position)
+        self.file.flush()
+        self.unflushed = 0
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+class LogSink:
+    def __init__(self, logger, names:dict=None, interval:float=1.0) -> None:
+        self.logger = logger
+        self.names = names or {}
+        self.interval = interval
+        self.last_time = 0.0
+        self.skipped = 0
+
+    def write(self, detections:np.array) -> None:
+        if not len(detections): return
+        now = time.monotonic()
+        if now - self.last_time < self.interval:
+            self.skipped += 1
+            return
+        self.last_time = now
+        classes, counts = np.unique(detections['class'], return_counts=True)
+        summary = ", ".join(f"{count} {self.names.get(int(class_id), class_id)}" for class_id, count in zip(classes, counts))
+        self.logger.warning(f"frame - {int(detections['frame'][0])} detections - {summary} (frames not logged - {self.skipped})")
+        self.skipped = 0
+
+    def close(self) -> None:
+        pass
+
+class DetectionSink:
+    def __init__(self, sinks:list, maxsize:int=1024, block:bool=False, logger=None) -> None:
+        self.sinks = sinks
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.block = block
+        self.logger = logger
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def _worker(self) -> None:
+        while True:
+            detections = self.queue.get()
+            if detections is None: break
+            for sink in self.sinks: sink.write(detections)
+        for sink in self.sinks: sink.close()
+
+    def submit(self, detections:np.array) -> None:
+        # recorded sinks must be complete, so they wait; otherwise a slow sink loses batches instead of stalling the caller
+        if self.block:
+            self.queue.put(detections)
+            return
+        try: self.queue.put_nowait(detections)
+        except queue.Full: self.dropped += 1
+
+    def close(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+        if self.dropped and self.logger is not None: self.logger.warning(f"detection sinks were too slow, {self.dropped} frames of detections were dropped")
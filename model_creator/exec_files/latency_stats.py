@@ -0,0 +1,89 @@
+import csv
+import json
+import math
+import time
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+class LatencyHistogram:
+    def __init__(self, min_ms:float=0.01, max_ms:float=10000.0, bins:int=600) -> None:
+        # log-spaced bins, about 2.3% wide at the defaults; slot 0 and the last slot catch out of range values
+        self.min_ms = min_ms
+        self.log_min = math.log(min_ms)
+        self.log_step = (math.log(max_ms) - self.log_min) / bins
+        self.bins = bins
+        self.edges = np.exp(self.log_min + self.log_step * np.arange(bins + 1))
+        self.counts = np.zeros(bins + 2, dtype=np.int64)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms:float) -> None:
+        if ms < self.min_ms: slot = 0
+        else: slot = min(int((math.log(ms) - self.log_min) / self.log_step) + 1, self.bins + 1)
+        self.counts[slot] += 1
+        self.total += 1
+        self.sum_ms += ms
+        if ms > self.max_ms: self.max_ms = ms
+
+    def percentile(self, p:float) -> float:
+        if not self.total: return 0.0
+        slot = int(np.searchsorted(np.cumsum(self.counts), math.ceil(self.total * p / 100)))
+        if slot == 0: return float(self.edges[0])
+        if slot > self.bins: return self.max_ms
+        # geometric middle of the bin
+        return float(math.sqrt(self.edges[slot - 1] * self.edges[slot]))
+
+    def summary(self) -> dict:
+        return {
+            "count": self.total,
+            "mean": self.sum_ms / self.total if self.total else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max_ms
+        }
+
+class StageProfiler:
+    def __init__(self, stages:list=None) -> None:
+        self.histograms = {}
+        self.lock = threading.Lock()
+        for name in stages or []: self.histograms[name] = LatencyHistogram()
+
+    def record(self, name:str, ms:float) -> None:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None: histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(ms)
+
+    @contextmanager
+    def stage(self, name:str):
+        start = time.perf_counter()
+        try: yield
+        finally: self.record(name, (time.perf_counter() - start) * 1000)
+
+    def report(self) -> dict:
+        with self.lock: return {name: histogram.summary() for name, histogram in self.histograms.items() if histogram.total}
+
+    def table(self) -> str:
+        lines = [f"{'stage':<16}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)"]
+        for name, stats in self.report().items():
+            lines.append(f"{name:<16}{stats['count']:>8}" + "".join(f"{stats[key]:>10.2f}" for key in ("mean", "p50", "p95", "p99", "max")))
+        return "\n".join(lines)
+
+    def export(self, path:str) -> None:
+        report = self.report()
+        if path.lower().endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["stage", "count", "mean", "p50", "p95", "p99", "max"])
+                for name, stats in report.items(): writer.writerow([name] + [stats[key] for key in ("count", "mean", "p50", "p95", "p99", "max")])
+        else:
+            with open(path, "w") as f: json.dump(report, f, indent=4)
+
+def record_predict_speed(profiler:StageProfiler, result) -> None:
+    # ultralytics measures its own preprocess/inference/postprocess split in ms
+    for key, name in (("preprocess", "predict_pre"), ("inference", "predict_infer"), ("postprocess", "predict_post")):
+        value = (result.speed or {}).get(key)
+        if value is not None: profiler.record(name, value)
\ No newline at end of file
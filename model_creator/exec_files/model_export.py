@@ -0,0 +1,136 @@
+import os
+import json
+import shutil
+import hashlib
+import importlib.util
+import numpy as np
+from ultralytics import YOLO
+from Logger import Logger
+
+BACKENDS = ("openvino", "onnx", "torchscript")
+# precisions ultralytics can produce for CPU inference, onnx int8 is made by onnxruntime dynamic quantization
+PRECISIONS = {"openvino": ("fp32", "fp16", "int8"), "onnx": ("fp32", "int8"), "torchscript": ("fp32",)}
+RUNTIMES = {"openvino": "openvino", "onnx": "onnxruntime", "torchscript": "torch"}
+INDEX_FILE = "exports.json"
+INDEX_VERSION = 1
+LOGGER = Logger(logger_name="YOLO_export").logger
+
+def checkpoint_hash(path:str) -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''): digest.update(chunk)
+    return digest.hexdigest()
+
+def exports_dir(model_path:str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(model_path)), f"{os.path.splitext(os.path.basename(model_path))[0]}_exports")
+
+def export_key(model_hash:str, backend:str, precision:str, imgsz:int) -> str:
+    return f"{model_hash}_{backend}_{precision}_{imgsz}"
+
+def load_index(model_path:str) -> dict:
+    try:
+        with open(os.path.join(exports_dir(model_path), INDEX_FILE), "r") as f: index = json.load(f)
+    except (OSError, ValueError): return {"version": INDEX_VERSION, "exports": {}}
+    if index.get("version") != INDEX_VERSION: return {"version": INDEX_VERSION, "exports": {}}
+    return index
+
+def save_index(model_path:str, index:dict) -> None:
+    os.makedirs(exports_dir(model_path), exist_ok=True)
+    path = os.path.join(exports_dir(model_path), INDEX_FILE)
+    with open(f"{path}.tmp", "w") as f: json.dump(index, f, indent=4)
+    os.replace(f"{path}.tmp", path)
+
+def runtime_available(backend:str) -> bool:
+    return importlib.util.find_spec(RUNTIMES[backend]) is not None
+
+def quantize_onnx(source:str, target:str) -> None:
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(source, target, weight_type=QuantType.QUInt8)
+    # ultralytics reads class names and imgsz from the model metadata, the quantizer does not keep it
+    source_model, target_model = onnx.load(source), onnx.load(target)
+    del target_model.metadata_props[:]
+    target_model.metadata_props.extend(source_model.metadata_props)
+    onnx.save(target_model, target)
+
+def export_model(model_path:str, backend:str, precision:str="fp32", imgsz:int=320, data:str=None) -> str:
+    # exported with a dynamic batch axis, partial eval batches and a varying number of ready streams share one artifact
+    if precision not in PRECISIONS[backend]: raise ValueError(f"{backend} has no {precision} export, expected one of {PRECISIONS[backend]}")
+    root = exports_dir(model_path)
+    model_hash = checkpoint_hash(model_path)
+    key = export_key(model_hash, backend, precision, imgsz)
+    entry = load_index(model_path)["exports"].get(key)
+    if entry is not None and os.path.exists(os.path.join(root, entry["path"])):
+        LOGGER.info(f"using cached {backend} {precision} export {entry['path']}")
+        return os.path.join(root, entry["path"])
+    tmp_path = os.path.join(root, f"{key}.tmp")
+    if os.path.exists(tmp_path): shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    LOGGER.info(f"exporting {model_path} to {backend} {precision}, imgsz {imgsz}")
+    if backend == "onnx" and precision == "int8":
+        source = export_model(model_path, backend, "fp32", imgsz)
+        artifact = os.path.join(tmp_path, os.path.basename(source))
+        quantize_onnx(source, artifact)
+    else:
+        options = {"format": backend, "imgsz": imgsz, "dynamic": backend != "torchscript", "half": precision == "fp16", "int8": precision == "int8", "device": "cpu"}
+        # int8 calibration needs images, ultralytics falls back to its sample dataset without data
+        if precision == "int8" and data: options["data"] = data
+        exported = YOLO(model_path).export(**options)
+        artifact = os.path.join(tmp_path, os.path.basename(os.path.normpath(exported)))
+        shutil.move(exported, artifact)
+    final_path = os.path.join(root, key)
+    if os.path.exists(final_path): shutil.rmtree(final_path)
+    os.replace(tmp_path, final_path)
+    index = load_index(model_path)
+    index["exports"][key] = {
+        "path": os.path.relpath(os.path.join(final_path, os.path.basename(artifact)), root),
+        "hash": model_hash, "backend": backend, "precision": precision, "imgsz": imgsz, "latency_ms": {}
+    }
+    save_index(model_path, index)
+    return os.path.join(root, index["exports"][key]["path"])
+
+def record_latency(model_path:str, backend:str, precision:str, imgsz:int, batch:int, latency_ms:float) -> None:
+    # per image latency of a predict call with batch images, batched and single frame speeds differ per backend
+    model_hash = checkpoint_hash(model_path)
+    key = export_key(model_hash, backend, precision, imgsz)
+    index = load_index(model_path)
+    # the checkpoint itself takes part in "auto" selection, it has no artifact to cache
+    if backend == "pt": index["exports"].setdefault(key, {"path": None, "hash": model_hash, "backend": "pt", "precision": "fp32", "imgsz": imgsz, "latency_ms": {}})
+    if key not in index["exports"]: return
+    index["exports"][key]["latency_ms"][str(batch)] = latency_ms
+    save_index(model_path, index)
+
+def fastest_backend(model_path:str, imgsz:int, batch:int=1) -> tuple:
+    # only measurements of this exact checkpoint, size and batch count, without any the checkpoint itself is used
+    model_hash = checkpoint_hash(model_path)
+    measured = [
+        (entry["latency_ms"][str(batch)], entry["backend"], entry["precision"]) for entry in load_index(model_path)["exports"].values()
+        if entry["hash"] == model_hash and entry["imgsz"] == imgsz and str(batch) in entry["latency_ms"]
+        and (entry["backend"] == "pt" or runtime_available(entry["backend"]))
+    ]
+    if not measured:
+        LOGGER.warning(f"no benchmarked backend for imgsz {imgsz} and batch {batch}, run --mode backends to measure them")
+        return "pt", "fp32"
+    _, backend, precision = min(measured)
+    return backend, precision
+
+def check_model(model:YOLO, imgsz:int, batch:int) -> None:
+    # fail at startup rather than on the first frame, a batch of two also checks the dynamic batch axis
+    frame = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    model.predict([frame] * min(batch, 2), imgsz=imgsz, verbose=False)
+
+def load_model(model_path:str, backend:str="auto", precision:str="fp32", imgsz:int=320, batch:int=1, data:str=None) -> tuple:
+    if backend == "auto":
+        backend, precision = fastest_backend(model_path, imgsz, batch)
+        LOGGER.info(f"selected backend {backend} {precision}")
+    if backend != "pt":
+        if not runtime_available(backend): LOGGER.error(f"{RUNTIMES[backend]} is not installed, falling back to the PyTorch checkpoint")
+        else:
+            try:
+                model = YOLO(export_model(model_path, backend, precision, imgsz, data), task="detect")
+                check_model(model, imgsz, batch)
+                return model, backend, precision
+            except Exception as e: LOGGER.error(f"{backend} {precision} model failed - {e}, falling back to the PyTorch checkpoint")
+    model = YOLO(model_path)
+    model.fuse()
+    return model, "pt", "fp32"
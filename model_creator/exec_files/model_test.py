@@ -1,9 +1,20 @@
+import os
+import csv
 import time
+import queue
+import argparse
+import threading
+from contextlib import nullcontext
 import cv2
+import numpy as np
 from ultralytics import YOLO
 import torch
-torch.set_num_threads(1)
 from Logger import Logger
+from model_export import BACKENDS, PRECISIONS, load_model, record_latency, runtime_available
+from latency_stats import StageProfiler, record_predict_speed
+from motion_gate import MotionGate
+from streams import StreamReader, read_sources
+from detections import DETECTION_DTYPE, DetectionSink, LogSink, RingBufferSink, JsonlSink, NpyAppendSink, extract_detections, draw_detections
 
 WINDOW_NAME = "YOLO test"
 TARGET_FPS = 60
@@ -11,102 +22,479 @@ FRAME_TIME = 1/TARGET_FPS
 RESOLUTION = (1280, 720)
 IMGSZ = 320
 CONF_THRESH = 0.5
+QUEUE_SIZE = 2
+DROP_OLDEST = True
+TORCH_THREADS = 1
+EVAL_BATCH = 8
+DATA_YAML = "./data.yaml"
+GATE_THRESHOLD = 0.002
+GATE_FORCE_EVERY = 10
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.wmv')
+END_OF_STREAM = object()
 LOGGER = Logger(logger_name="YOLO_test").logger
 
 class FPS_monitor:
     def __init__(self, avg_window=10) -> None:
-        self.times = []
+        self.times = np.zeros(avg_window)
+        self.count = 0
         self.avg_window = avg_window
     
     def update(self) -> None:
-        self.times.append(time.time())
-        if len(self.times) > self.avg_window: self.times.pop(0)
+        self.times[self.count % self.avg_window] = time.perf_counter()
+        self.count += 1
     
     def get_fps(self) -> int:
-        if len(self.times) < 2: return 0
-        return (len(self.times) - 1) / (self.times[-1] - self.times[0])
+        samples = min(self.count, self.avg_window)
+        if samples < 2: return 0
+        newest = self.times[(self.count - 1) % self.avg_window]
+        oldest = self.times[self.count % self.avg_window] if self.count >= self.avg_window else self.times[0]
+        return (samples - 1) / (newest - oldest)
 
-def init_model(model_path:str) -> YOLO:
-    model = YOLO(model_path)
-    model.fuse()
-    LOGGER.info(f"YOLO-model is loaded")
+class FrameQueue:
+    def __init__(self, maxsize:int=QUEUE_SIZE, drop_oldest:bool=DROP_OLDEST) -> None:
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.drop_oldest = drop_oldest
+        self.dropped = 0
+
+    def put(self, item, stop:threading.Event) -> None:
+        while not stop.is_set():
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                if not self.drop_oldest:
+                    time.sleep(0.001)
+                    continue
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty: pass
+
+    def get(self, timeout:float=0.05):
+        try: return self.queue.get(timeout=timeout)
+        except queue.Empty: return None
+
+def init_model(model_path:str, backend:str="pt", precision:str="fp32", batch:int=1) -> YOLO:
+    model, backend, precision = load_model(model_path, backend, precision, IMGSZ, batch, DATA_YAML if os.path.exists(DATA_YAML) else None)
+    LOGGER.info(f"YOLO-model is loaded ({backend} {precision})")
     return model
 
-def process_frame(frame, model:YOLO):
-    frame = cv2.resize(frame, RESOLUTION, interpolation=cv2.INTER_AREA)
-    results = model.predict(
-        frame,
-        imgsz=IMGSZ,
-        conf=CONF_THRESH,
-        augment=False,
-        verbose=False
-    )
-    for result in results:
-        for i, box in enumerate(result.boxes):
-            class_id = int(box.cls[0])
-            class_name = result.names[class_id]
-            confidence = float(box.conf[0])
-            bbox = [int(coord) for coord in box.xyxy[0].tolist()]
-            LOGGER.warning(f"class - {class_id} class_name - {class_name} conf - {confidence:.2f} bbox - {bbox}")  
-    return results[0].plot()
-
-def get_video(video_path:str, model:YOLO):
+def create_sink(kinds:list, names:dict, out_dir:str) -> DetectionSink:
+    sinks = []
+    for kind in kinds:
+        if kind == "log": sinks.append(LogSink(LOGGER, names))
+        elif kind == "ring": sinks.append(RingBufferSink())
+        else:
+            os.makedirs(out_dir, exist_ok=True)
+            path = os.path.join(out_dir, f"detections_{int(time.time())}.{kind}")
+            sinks.append(JsonlSink(path, names) if kind == "jsonl" else NpyAppendSink(path))
+            LOGGER.info(f"detections are written to {path}")
+    return DetectionSink(sinks, block=any(kind in ("jsonl", "npy") for kind in kinds), logger=LOGGER)
+
+def process_frame(frame, model:YOLO, sink:DetectionSink=None, frame_index:int=0, profiler:StageProfiler=None, resolution:tuple=RESOLUTION, imgsz:int=IMGSZ):
+    stage = profiler.stage if profiler is not None else lambda name: nullcontext()
+    with stage("resize"): frame = cv2.resize(frame, resolution, interpolation=cv2.INTER_AREA)
+    with stage("predict"):
+        results = model.predict(
+            frame,
+            imgsz=imgsz,
+            conf=CONF_THRESH,
+            augment=False,
+            verbose=False
+        )
+    if profiler is not None: record_predict_speed(profiler, results[0])
+    if sink is not None: sink.submit(extract_detections(results[0], frame_index))
+    with stage("plot"): return results[0].plot()
+
+def gated_process_frame(frame, model:YOLO, gate:MotionGate, sink:DetectionSink=None, frame_index:int=0, profiler:StageProfiler=None):
+    profiler = profiler or StageProfiler()
+    with profiler.stage("gate"): infer = gate.check(frame)
+    with profiler.stage("resize"): frame = cv2.resize(frame, RESOLUTION, interpolation=cv2.INTER_AREA)
+    if infer:
+        with profiler.stage("predict"): results = model.predict(frame, imgsz=IMGSZ, conf=CONF_THRESH, augment=False, verbose=False)
+        record_predict_speed(profiler, results[0])
+        detections = extract_detections(results[0], frame_index)
+        gate.update(detections)
+    else:
+        with profiler.stage("carry"): detections = gate.carry(frame_index, RESOLUTION)
+    if sink is not None: sink.submit(detections)
+    with profiler.stage("plot"): return draw_detections(frame, detections, model.names)
+
+def decode_stage(cap:cv2.VideoCapture, frames:FrameQueue, control:queue.Queue, stop:threading.Event, profiler:StageProfiler, speed:float=1.0) -> None:
+    paused = False
+    generation = 0
+    single_frame = False
+    next_time = time.perf_counter()
+    while not stop.is_set():
+        try:
+            command, value = control.get(timeout=0.05) if paused and not single_frame else control.get_nowait()
+            if command == "pause": paused = value
+            elif command == "rewind":
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                generation = value
+                single_frame = True
+            continue
+        except queue.Empty:
+            if paused and not single_frame: continue
+        with profiler.stage("decode"): ret, frame = cap.read()
+        if not ret:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            continue
+        single_frame = False
+        frames.put((generation, int(cap.get(cv2.CAP_PROP_POS_FRAMES)), frame), stop)
+        # pace the source to real time, a backed up pipeline is handled by the queues
+        next_time = max(next_time + FRAME_TIME / speed, time.perf_counter() - FRAME_TIME / speed)
+        delay = next_time - time.perf_counter()
+        if delay > 0: time.sleep(delay)
+
+def inference_stage(model:YOLO, frames:FrameQueue, results:FrameQueue, stop:threading.Event, profiler:StageProfiler, sink:DetectionSink=None, gate:MotionGate=None) -> None:
+    generation = 0
+    while not stop.is_set():
+        item = frames.get()
+        if item is None: continue
+        frame_generation, frame_index, frame = item
+        if gate is None:
+            results.put((frame_generation, frame_index, process_frame(frame, model, sink, frame_index, profiler)), stop)
+            continue
+        # detections of the old position are never carried over a rewind
+        if frame_generation != generation:
+            generation = frame_generation
+            gate.reset()
+        results.put((frame_generation, frame_index, gated_process_frame(frame, model, gate, sink, frame_index, profiler)), stop)
+
+def get_video(video_path:str, model:YOLO, sink:DetectionSink=None, profiler:StageProfiler=None, gate:MotionGate=None):
     fps_monitor = FPS_monitor()
+    profiler = profiler or StageProfiler()
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened(): 
         LOGGER.critical("can't open video-file")
         return
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = FrameQueue()
+    results = FrameQueue()
+    control = queue.Queue()
+    stop = threading.Event()
+    stages = [
+        threading.Thread(target=decode_stage, args=(cap, frames, control, stop, profiler), daemon=True),
+        threading.Thread(target=inference_stage, args=(model, frames, results, stop, profiler, sink, gate), daemon=True)
+    ]
+    for stage in stages: stage.start()
     paused = False
-    step_mode = False
-    speed = 1.0
-    manual_frame_change = False
+    generation = 0
+    controls = [
+        "Space: Play/Pause",
+        "R: Rewind",
+        "Q: Quit"
+    ]
     try:
         while True:
-            if not paused or manual_frame_change:
-                start_time = time.perf_counter()
-                if manual_frame_change: manual_frame_change = False
-                else:
-                    ret, frame = cap.read()
-                    if not ret: 
-                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                        continue
-                ret, frame = cap.retrieve() if manual_frame_change else (ret, frame)
-                if not ret: continue
-                annotated_frame = process_frame(frame, model)
+            item = results.get(timeout=FRAME_TIME)
+            if item is not None and item[0] == generation:
+                _, current_frame, annotated_frame = item
                 fps_monitor.update()
                 current_fps = fps_monitor.get_fps()
-                controls = [
-                    "Space: Play/Pause",
-                    "R: Rewind",
-                    "Q: Quit"
-                ]
-                for i, control in enumerate(controls):
-                    cv2.putText(annotated_frame, control, (10, 30 + i*25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
-                current_frame = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-                cv2.putText(annotated_frame, f"Frame: {current_frame}/{total_frames}", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
-                cv2.putText(annotated_frame, f"FPS: {current_fps:.1f}", (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
-                cv2.imshow(WINDOW_NAME, annotated_frame)
-                if not paused and not step_mode:
-                    elapsed = time.perf_counter() - start_time
-                    delay = max(1, int((FRAME_TIME/speed - elapsed) * 1000))
-                    key = cv2.waitKey(delay)
-                else: key = cv2.waitKey(0)
-            else: key = cv2.waitKey(0)
-            if key == ord(' '): paused = not paused
+                with profiler.stage("overlay"):
+                    for i, control_text in enumerate(controls):
+                        cv2.putText(annotated_frame, control_text, (10, 30 + i*25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
+                    cv2.putText(annotated_frame, f"Frame: {current_frame}/{total_frames}", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
+                    cv2.putText(annotated_frame, f"FPS: {current_fps:.1f}", (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
+                    cv2.putText(annotated_frame, f"Dropped: {frames.dropped + results.dropped}", (10, 180), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
+                    if gate is not None: cv2.putText(annotated_frame, f"Skipped: {gate.skip_ratio():.0%}", (10, 210), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
+                with profiler.stage("imshow"): cv2.imshow(WINDOW_NAME, annotated_frame)
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord(' '):
+                paused = not paused
+                control.put(("pause", paused))
             elif key == ord('q'): break
             elif key == ord('r'):
-                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                manual_frame_change = True
+                generation += 1
+                control.put(("rewind", generation))
     except KeyboardInterrupt: pass
     finally:
+        stop.set()
+        for stage in stages: stage.join()
         cap.release()
         cv2.destroyAllWindows()
+        if gate is not None: LOGGER.info(f"motion gate skipped {gate.skipped} of {gate.frames} frames ({gate.skip_ratio():.0%})")
+        LOGGER.info(f"stage latencies:\n{profiler.table()}")
+
+def list_videos(source:str) -> list:
+    if os.path.isdir(source): return sorted(os.path.join(source, name) for name in os.listdir(source) if name.lower().endswith(VIDEO_EXTENSIONS))
+    return [source]
+
+def batch_decode_stage(cap:cv2.VideoCapture, batches:FrameQueue, batch:int, stop:threading.Event, profiler:StageProfiler) -> None:
+    frame_index = 0
+    while not stop.is_set():
+        indices, frames = [], []
+        while len(frames) < batch:
+            with profiler.stage("decode"): ret, frame = cap.read()
+            if not ret: break
+            indices.append(frame_index)
+            with profiler.stage("resize"): frames.append(cv2.resize(frame, RESOLUTION, interpolation=cv2.INTER_AREA))
+            frame_index += 1
+        if frames: batches.put((indices, frames), stop)
+        if len(frames) < batch: break
+    batches.put(END_OF_STREAM, stop)
+
+def evaluate_video(video_path:str, model:YOLO, out_dir:str, batch:int=EVAL_BATCH, save_video:bool=False, sink:DetectionSink=None, profiler:StageProfiler=None) -> int:
+    profiler = profiler or StageProfiler()
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        LOGGER.critical(f"can't open video-file {video_path}")
+        return 0
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    writer = None
+    if save_video:
+        fps = cap.get(cv2.CAP_PROP_FPS) or TARGET_FPS
+        writer = cv2.VideoWriter(os.path.join(out_dir, f"{name}_annotated.mp4"), cv2.VideoWriter_fourcc(*"mp4v"), fps, RESOLUTION)
+    batches = FrameQueue(maxsize=QUEUE_SIZE, drop_oldest=False)
+    stop = threading.Event()
+    decoder = threading.Thread(target=batch_decode_stage, args=(cap, batches, batch, stop, profiler), daemon=True)
+    decoder.start()
+    parts = []
+    frames_done = 0
+    try:
+        while (item := batches.get()) is not END_OF_STREAM:
+            if item is None:
+                if not decoder.is_alive(): break
+                continue
+            indices, frames = item
+            with profiler.stage("predict_batch"): results = model.predict(frames, imgsz=IMGSZ, conf=CONF_THRESH, augment=False, verbose=False)
+            for frame_index, result in zip(indices, results):
+                record_predict_speed(profiler, result)
+                detections = extract_detections(result, frame_index)
+                parts.append(detections)
+                if sink is not None: sink.submit(detections)
+                if writer is not None:
+                    with profiler.stage("plot"): annotated = result.plot()
+                    writer.write(annotated)
+            frames_done += len(frames)
+    finally:
+        stop.set()
+        decoder.join()
+        cap.release()
+        if writer is not None: writer.release()
+    detections = np.concatenate(parts) if parts else np.empty(0, dtype=DETECTION_DTYPE)
+    np.savez(os.path.join(out_dir, f"{name}_detections.npz"), **{key: detections[key] for key in ("frame", "x1", "y1", "x2", "y2", "conf", "class")})
+    LOGGER.info(f"{name}: {frames_done} frames, {len(detections)} detections")
+    return frames_done
 
-def main(model_path:str) -> None:
-    video_path = input("\nEnter path to video: ").replace("'", "").replace('"', '')
-    model = init_model(model_path)
-    get_video(video_path=video_path, model=model)
+def evaluate(source:str, model:YOLO, out_dir:str, batch:int=EVAL_BATCH, save_video:bool=False, sink:DetectionSink=None, profiler:StageProfiler=None) -> None:
+    profiler = profiler or StageProfiler()
+    videos = list_videos(source)
+    if not videos:
+        LOGGER.critical(f"no videos found in {source}")
+        return
+    os.makedirs(out_dir, exist_ok=True)
+    start_time = time.perf_counter()
+    total_frames = 0
+    for video_path in videos: total_frames += evaluate_video(video_path, model, out_dir, batch, save_video, sink, profiler)
+    elapsed = time.perf_counter() - start_time
+    LOGGER.info(f"Processed {len(videos)} videos, {total_frames} frames in {elapsed:.1f}s - {total_frames / max(elapsed, 1e-9):.1f} FPS")
+    LOGGER.info(f"stage latencies:\n{profiler.table()}")
+
+def next_stream_batch(readers:list, ready:threading.Condition, start:int, batch:int, timeout:float=0.1) -> list:
+    # round robin from the stream after the last one served, so with more ready streams than batch slots nobody starves
+    with ready:
+        while True:
+            order = [(start + i) % len(readers) for i in range(len(readers))]
+            picked = [i for i in order if readers[i].latest is not None][:batch]
+            if picked or all(reader.finished for reader in readers): break
+            if not ready.wait(timeout): return []
+        return [(i, *readers[i].take()) for i in picked]
+
+def log_streams(readers:list, monitors:list, processed:list, elapsed:float) -> None:
+    for reader, monitor, count in zip(readers, monitors, processed):
+        LOGGER.info(f"stream {reader.stream_id} {reader.source}: {monitor.get_fps():.1f} FPS, processed {count}, decoded {reader.decoded}, replaced before inference {reader.overwritten}")
+    LOGGER.info(f"total: {sum(processed) / max(elapsed, 1e-9):.1f} FPS over {len(readers)} streams")
+
+def serve_streams(sources:list, model:YOLO, batch:int=EVAL_BATCH, sink:DetectionSink=None, profiler:StageProfiler=None, duration:float=None, loop:bool=True, report_every:float=5.0) -> None:
+    profiler = profiler or StageProfiler()
+    ready = threading.Condition()
+    stop = threading.Event()
+    readers = [StreamReader(i, source, ready, stop, loop) for i, source in enumerate(sources)]
+    monitors = [FPS_monitor(avg_window=30) for _ in readers]
+    processed = [0] * len(readers)
+    for reader in readers: reader.start()
+    LOGGER.info(f"serving {len(readers)} streams, batch {batch}")
+    start_time = last_report = time.perf_counter()
+    next_stream = 0
+    try:
+        while not (duration and time.perf_counter() - start_time > duration):
+            items = next_stream_batch(readers, ready, next_stream, batch)
+            if not items:
+                if all(reader.finished for reader in readers): break
+                continue
+            next_stream = (items[-1][0] + 1) % len(readers)
+            with profiler.stage("resize"): frames = [cv2.resize(frame, RESOLUTION, interpolation=cv2.INTER_AREA) for _, _, frame in items]
+            with profiler.stage("predict_batch"): results = model.predict(frames, imgsz=IMGSZ, conf=CONF_THRESH, augment=False, verbose=False)
+            for (stream_id, frame_index, _), result in zip(items, results):
+                record_predict_speed(profiler, result)
+                if sink is not None: sink.submit(extract_detections(result, frame_index, stream=stream_id))
+                monitors[stream_id].update()
+                processed[stream_id] += 1
+            if time.perf_counter() - last_report >= report_every:
+                last_report = time.perf_counter()
+                log_streams(readers, monitors, processed, last_report - start_time)
+    except KeyboardInterrupt: pass
+    finally:
+        stop.set()
+        for reader in readers: reader.join()
+        log_streams(readers, monitors, processed, time.perf_counter() - start_time)
+        LOGGER.info(f"stage latencies:\n{profiler.table()}")
+
+def synthetic_frames(count:int, size:tuple=(1920, 1080)) -> list:
+    rng = np.random.default_rng(0)
+    width, height = size
+    background = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 15)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        for j in range(5):
+            x = int((i * (3 + j) + j * width / 5) % (width - 200))
+            y = int(height / 2 + (height / 3) * np.sin(i / 20 + j))
+            cv2.rectangle(frame, (x, y - 60), (x + 160 + 20 * j, y + 60), (40 * j, 200, 255 - 40 * j), -1)
+        frames.append(frame)
+    return frames
+
+def load_frames(source:str, count:int) -> list:
+    cap = cv2.VideoCapture(source)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret: break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def parse_resolution(text:str) -> tuple:
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+def benchmark(model:YOLO, source:str, out_dir:str, imgsz_list:list, threads_list:list, resolutions:list, frames_count:int=120, baseline:str=None, tolerance:float=0.1) -> list:
+    frames = load_frames(source, frames_count) if source else synthetic_frames(frames_count)
+    if not frames:
+        LOGGER.critical(f"can't read frames from {source}")
+        return []
+    LOGGER.info(f"benchmark on {len(frames)} {'frames of ' + source if source else 'synthetic frames'}")
+    rows = []
+    for threads in threads_list:
+        torch.set_num_threads(threads)
+        for imgsz in imgsz_list:
+            for resolution in resolutions:
+                for frame in frames[:3]: process_frame(frame, model, resolution=resolution, imgsz=imgsz)
+                profiler = StageProfiler()
+                start_time = time.perf_counter()
+                for frame in frames:
+                    with profiler.stage("total"): process_frame(frame, model, profiler=profiler, resolution=resolution, imgsz=imgsz)
+                elapsed = time.perf_counter() - start_time
+                report = profiler.report()
+                row = {
+                    "imgsz": imgsz,
+                    "threads": threads,
+                    "resolution": f"{resolution[0]}x{resolution[1]}",
+                    "fps": round(len(frames) / elapsed, 2)
+                }
+                row.update({f"total_{key}": round(report["total"][key], 2) for key in ("p50", "p95", "p99")})
+                row.update({f"{name}_p50": round(stats["p50"], 2) for name, stats in report.items() if name != "total"})
+                rows.append(row)
+                LOGGER.info(f"imgsz={imgsz} threads={threads} resolution={row['resolution']}: {row['fps']} FPS, p50 {row['total_p50']} ms, p99 {row['total_p99']} ms")
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"bench_{int(time.time())}.csv")
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    LOGGER.info(f"benchmark table is written to {path}")
+    if baseline: compare_with_baseline(rows, baseline, tolerance)
+    return rows
+
+def compare_with_baseline(rows:list, baseline:str, tolerance:float=0.1) -> int:
+    with open(baseline, newline="") as f: previous = {(row["imgsz"], row["threads"], row["resolution"]): row for row in csv.DictReader(f)}
+    regressions = 0
+    for row in rows:
+        old = previous.get((str(row["imgsz"]), str(row["threads"]), row["resolution"]))
+        if old is None: continue
+        change = row["total_p50"] / float(old["total_p50"]) - 1
+        if change > tolerance:
+            regressions += 1
+            LOGGER.error(f"regression imgsz={row['imgsz']} threads={row['threads']} resolution={row['resolution']}: p50 {old['total_p50']} -> {row['total_p50']} ms ({change:+.0%})")
+    if not regressions: LOGGER.info(f"no p50 regressions over {tolerance:.0%} against {baseline}")
+    return regressions
+
+def benchmark_backends(model_path:str, source:str, out_dir:str, backends:list, precisions:list, frames_count:int=120, batch:int=EVAL_BATCH) -> list:
+    # every backend runs on the same frames at IMGSZ, one frame per call and batch frames per call, as auto selection looks both up
+    frames = load_frames(source, frames_count) if source else synthetic_frames(frames_count)
+    if not frames:
+        LOGGER.critical(f"can't read frames from {source}")
+        return []
+    rows = []
+    for backend in backends:
+        for precision in precisions:
+            if backend != "pt" and (precision not in PRECISIONS[backend] or not runtime_available(backend)): continue
+            if backend == "pt" and precision != "fp32": continue
+            load_start = time.perf_counter()
+            model, loaded_backend, loaded_precision = load_model(model_path, backend, precision, IMGSZ, batch, DATA_YAML if os.path.exists(DATA_YAML) else None)
+            load_time = time.perf_counter() - load_start
+            if (loaded_backend, loaded_precision) != (backend, precision): continue
+            for frame in frames[:3]: process_frame(frame, model)
+            profiler = StageProfiler()
+            for frame in frames:
+                with profiler.stage("total"): process_frame(frame, model, profiler=profiler)
+            resized = [cv2.resize(frame, RESOLUTION, interpolation=cv2.INTER_AREA) for frame in frames]
+            for start in range(0, len(resized) - batch + 1, batch):
+                with profiler.stage("predict_batch"): model.predict(resized[start:start + batch], imgsz=IMGSZ, conf=CONF_THRESH, augment=False, verbose=False)
+            report = profiler.report()
+            record_latency(model_path, backend, precision, IMGSZ, 1, report["predict"]["p50"])
+            row = {"backend": backend, "precision": precision, "load_s": round(load_time, 2), "fps": round(1000 / report["total"]["mean"], 2)}
+            row.update({f"predict_{key}": round(report["predict"][key], 2) for key in ("p50", "p95", "p99")})
+            if "predict_batch" in report:
+                row[f"batch{batch}_per_image_p50"] = round(report["predict_batch"]["p50"] / batch, 2)
+                record_latency(model_path, backend, precision, IMGSZ, batch, row[f"batch{batch}_per_image_p50"])
+            rows.append(row)
+            LOGGER.info(f"{backend} {precision}: {row['fps']} FPS, predict p50 {row['predict_p50']} ms, p99 {row['predict_p99']} ms, loaded in {row['load_s']}s")
+    if not rows: return rows
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"backends_{int(time.time())}.csv")
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(dict.fromkeys(key for row in rows for key in row)))
+        writer.writeheader()
+        writer.writerows(rows)
+    best = min(rows, key=lambda row: row["predict_p50"])
+    LOGGER.info(f"fastest backend is {best['backend']} {best['precision']}, table is written to {path}")
+    return rows
+
+def main(model_path:str, args:argparse.Namespace) -> None:
+    torch.set_num_threads(args.threads)
+    if args.mode == "backends":
+        benchmark_backends(model_path, args.source, args.out, args.backends, args.precisions, args.bench_frames, args.batch)
+        return
+    if args.mode == "bench":
+        # the sweep changes imgsz and torch threads, exports are fixed to one size and ignore torch threads
+        if args.backend not in ("auto", "pt"): LOGGER.warning("bench mode always runs the PyTorch checkpoint, compare backends with --mode backends")
+        model = init_model(model_path, "pt")
+        resolutions = [parse_resolution(text) for text in args.bench_resolutions]
+        benchmark(model, args.source, args.out, args.bench_imgsz, args.bench_threads, resolutions, args.bench_frames, args.baseline)
+        return
+    if args.mode == "streams":
+        if args.sources or args.source: sources = read_sources(args.sources or [args.source])
+        else: sources = read_sources(input("\nEnter paths or URLs of streams separated by spaces: ").replace("'", "").replace('"', '').split())
+    elif args.mode == "eval":
+        source = args.source or input("\nEnter path to video or folder with videos: ").replace("'", "").replace('"', '')
+    else: source = args.source or input("\nEnter path to video: ").replace("'", "").replace('"', '')
+    model = init_model(model_path, args.backend, args.precision, args.batch if args.mode in ("eval", "streams") else 1)
+    sink = create_sink(args.sink, model.names, args.out) if args.sink else None
+    profiler = StageProfiler()
+    try:
+        if args.mode == "streams": serve_streams(sources, model, args.batch, sink, profiler, args.duration, not args.no_loop)
+        elif args.mode == "eval": evaluate(source, model, args.out, batch=args.batch, save_video=args.save_video, sink=sink, profiler=profiler)
+        else:
+            gate = MotionGate(args.gate_threshold, args.gate_every, track=not args.gate_no_track) if args.gate else None
+            get_video(video_path=source, model=model, sink=sink, profiler=profiler, gate=gate)
+    finally:
+        if sink is not None: sink.close()
+        if args.stats: profiler.export(args.stats)
     
 if __name__ == "__main__":
     art = '''
@@ -117,5 +505,32 @@ if __name__ == "__main__":
 /____/___/\____/_/ |_/_/  |_/_____/  /_____/___/ /_/
     '''
     print(art)
-    model_path = input("\nEnter path to YOLO-model: ").replace("'", "").replace('"', '')
-    main(model_path=model_path)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="YOLO model test")
+    parser.add_argument("--model", help="path to YOLO-model")
+    parser.add_argument("--mode", choices=["play", "eval", "streams", "bench", "backends"], default="play", help="interactive playback, headless evaluation, multi-stream serving, benchmark or backend comparison")
+    parser.add_argument("--source", help="video file, or a folder of videos in eval mode; bench uses synthetic frames without it")
+    parser.add_argument("--backend", choices=["auto", "pt"] + list(BACKENDS), default="auto", help="inference backend, auto picks the fastest one measured by --mode backends for this batch size")
+    parser.add_argument("--precision", choices=["fp32", "fp16", "int8"], default="fp32", help="precision of the exported model")
+    parser.add_argument("--sources", nargs="+", help="video files or stream URLs in streams mode, or a .txt file listing them")
+    parser.add_argument("--batch", type=int, default=EVAL_BATCH, help="frames per predict call in eval and streams modes, also measured by --mode backends")
+    parser.add_argument("--duration", type=float, help="stop streams mode after this many seconds")
+    parser.add_argument("--no-loop", action="store_true", help="stop file sources at their end instead of looping them")
+    parser.add_argument("--threads", type=int, default=TORCH_THREADS, help="torch CPU threads")
+    parser.add_argument("--out", default="./eval_results", help="output folder for eval results and detection files")
+    parser.add_argument("--sink", nargs="*", choices=["log", "ring", "jsonl", "npy"], default=["log"], help="where detections go, rate-limited log by default")
+    parser.add_argument("--save-video", action="store_true", help="write annotated videos in eval mode")
+    parser.add_argument("--gate", action="store_true", help="skip inference on frames that barely changed and carry detections over")
+    parser.add_argument("--gate-threshold", type=float, default=GATE_THRESHOLD, help="share of changed pixels that triggers inference")
+    parser.add_argument("--gate-every", type=int, default=GATE_FORCE_EVERY, help="force a full inference every K frames")
+    parser.add_argument("--gate-no-track", action="store_true", help="carry boxes unchanged instead of shifting them by phase correlation")
+    parser.add_argument("--stats", help="export stage latencies to a .json or .csv file")
+    parser.add_argument("--bench-imgsz", type=int, nargs="+", default=[IMGSZ], help="IMGSZ values to benchmark")
+    parser.add_argument("--bench-threads", type=int, nargs="+", default=[TORCH_THREADS], help="thread counts to benchmark")
+    parser.add_argument("--bench-resolutions", nargs="+", default=[f"{RESOLUTION[0]}x{RESOLUTION[1]}"], help="resize resolutions to benchmark, e.g. 1280x720")
+    parser.add_argument("--bench-frames", type=int, default=120, help="frames per benchmark run")
+    parser.add_argument("--backends", nargs="+", choices=["pt"] + list(BACKENDS), default=["pt"] + list(BACKENDS), help="backends to compare")
+    parser.add_argument("--precisions", nargs="+", choices=["fp32", "fp16", "int8"], default=["fp32"], help="precisions to compare")
+    parser.add_argument("--baseline", help="previous benchmark csv to check for regressions")
+    args = parser.parse_args()
+    model_path = args.model or input("\nEnter path to YOLO-model: ").replace("'", "").replace('"', '')
+    main(model_path=model_path, args=args)
\ No newline at end of file
@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+
+class MotionGate:
+    def __init__(self, threshold:float=0.002, force_every:int=10, pixel_delta:int=20, size:tuple=(320, 180), track:bool=True) -> None:
+        # threshold is the share of gate pixels that changed by more than pixel_delta since the last inference
+        self.threshold = threshold
+        self.force_every = force_every
+        self.pixel_delta = pixel_delta
+        self.size = size
+        self.track = track
+        self.reference = None
+        self.current = None
+        self.detections = None
+        self.since_inference = 0
+        self.frames = 0
+        self.skipped = 0
+
+    def check(self, frame:np.array) -> bool:
+        self.current = cv2.cvtColor(cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        self.frames += 1
+        # compared with the last inferred frame, so slow motion adds up until it triggers a new inference
+        if self.reference is None or self.detections is None or self.since_inference + 1 >= self.force_every: return True
+        changed = np.count_nonzero(cv2.absdiff(self.current, self.reference) > self.pixel_delta) / self.current.size
+        if changed >= self.threshold: return True
+        self.since_inference += 1
+        self.skipped += 1
+        return False
+
+    def update(self, detections:np.array) -> None:
+        self.reference = self.current
+        self.detections = detections.copy()
+        self.since_inference = 0
+
+    def reset(self) -> None:
+        self.reference = None
+        self.detections = None
+
+    def carry(self, frame_index:int, resolution:tuple) -> np.array:
+        detections = self.detections.copy()
+        detections['frame'] = frame_index
+        if not self.track: return detections
+        scale_x = self.size[0] / resolution[0]
+        scale_y = self.size[1] / resolution[1]
+        for detection in detections:
+            dx, dy = self._box_shift(detection['x1'] * scale_x, detection['y1'] * scale_y, detection['x2'] * scale_x, detection['y2'] * scale_y)
+            detection['x1'] += dx / scale_x
+            detection['x2'] += dx / scale_x
+            detection['y1'] += dy / scale_y
+            detection['y2'] += dy / scale_y
+        return detections
+
+    def _box_shift(self, x1:float, y1:float, x2:float, y2:float) -> tuple:
+        # phase correlation of the padded box patch between the last inferred frame and the current one
+        pad_x, pad_y = (x2 - x1) / 4 + 2, (y2 - y1) / 4 + 2
+        left, top = max(int(x1 - pad_x), 0), max(int(y1 - pad_y), 0)
+        right, bottom = min(int(x2 + pad_x) + 1, self.size[0]), min(int(y2 + pad_y) + 1, self.size[1])
+        if right - left < 8 or bottom - top < 8: return 0.0, 0.0
+        patch_a = np.float32(self.reference[top:bottom, left:right])
+        patch_b = np.float32(self.current[top:bottom, left:right])
+        window = cv2.createHanningWindow((right - left, bottom - top), cv2.CV_32F)
+        (dx, dy), response = cv2.phaseCorrelate(patch_a, patch_b, window)
+        if response < 0.1 or abs(dx) > pad_x or abs(dy) > pad_y: return 0.0, 0.0
+        return dx, dy
+
+    def skip_ratio(self) -> float:
+        return self.skipped / self.frames if self.frames else 0.0
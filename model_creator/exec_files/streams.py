@@ -0,0 +1,89 @@
+import os
+import time
+import threading
+import cv2
+from Logger import Logger
+
+RECONNECT_ATTEMPTS = 5
+LOGGER = Logger(logger_name="YOLO_streams").logger
+
+class StreamReader:
+    def __init__(self, stream_id:int, source:str, ready:threading.Condition, stop:threading.Event, loop:bool=True, reconnect_delay:float=1.0, reconnect_attempts:int=RECONNECT_ATTEMPTS) -> None:
+        self.stream_id = stream_id
+        self.source = source
+        self.ready = ready
+        self.stop = stop
+        # files stand in for cameras: paced to their own FPS and looped, URLs are read as fast as they arrive
+        self.live = "://" in source
+        self.loop = loop
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_attempts = reconnect_attempts
+        self.latest = None
+        self.decoded = 0
+        self.overwritten = 0
+        self.finished = False
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def _worker(self) -> None:
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened(): LOGGER.error(f"stream {self.stream_id}: can't open {self.source}")
+        frame_time = 1 / (cap.get(cv2.CAP_PROP_FPS) or 30)
+        next_time = time.perf_counter()
+        failures = 0
+        try:
+            while not self.stop.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    if self.live:
+                        failures += 1
+                        # a source that never produced a frame is most likely a wrong URL
+                        if not self.decoded and failures > self.reconnect_attempts:
+                            LOGGER.error(f"stream {self.stream_id}: no frames from {self.source} after {self.reconnect_attempts} reconnects, giving up")
+                            break
+                        LOGGER.warning(f"stream {self.stream_id}: {self.source} is not responding, reconnect {failures}")
+                        cap.release()
+                        self.stop.wait(self.reconnect_delay)
+                        cap = cv2.VideoCapture(self.source)
+                        continue
+                    if not self.decoded and cap.isOpened(): LOGGER.error(f"stream {self.stream_id}: no frames in {self.source}")
+                    if not self.loop or not self.decoded: break
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                if failures: LOGGER.info(f"stream {self.stream_id}: {self.source} is back")
+                failures = 0
+                with self.ready:
+                    # only the newest frame is kept, an unserved one is replaced
+                    if self.latest is not None: self.overwritten += 1
+                    self.latest = (self.decoded, frame)
+                    self.decoded += 1
+                    self.ready.notify()
+                if self.live: continue
+                next_time = max(next_time + frame_time, time.perf_counter() - frame_time)
+                delay = next_time - time.perf_counter()
+                if delay > 0: time.sleep(delay)
+        finally:
+            cap.release()
+            with self.ready:
+                self.finished = True
+                self.ready.notify()
+
+    def take(self) -> tuple or None:
+        # the caller holds the ready condition
+        item = self.latest
+        self.latest = None
+        return item
+
+    def join(self) -> None:
+        self.thread.join()
+
+def read_sources(sources:list) -> list:
+    # a .txt argument is a list of sources, one per line
+    result = []
+    for source in sources:
+        if source.lower().endswith(".txt") and os.path.isfile(source):
+            with open(source, "r") as f: result.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+        else: result.append(source)
+    return result
@@ -1,3 +1,3 @@
 @echo off
 call ../.venv/scripts/activate
-python ./exec_files/model_test.py
\ No newline at end of file
+python ./exec_files/model_test.py %*
\ No newline at end of file